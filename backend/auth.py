@@ -1,26 +1,26 @@
 from datetime import datetime, timedelta
+from typing import Optional
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from config import settings
-from models import User
-from database import get_db
+from models import User, UserVersion
+from database import get_db, get_async_db, run_db
+from hashing import hashing_pool
+from cache import TTLCache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+# Decoded token -> detached User. Entries on other replicas can stay stale
+# for up to auth_cache_ttl_seconds after a profile change.
+principal_cache = TTLCache(
+    "principal",
+    maxsize=settings.auth_cache_max_entries,
+    ttl=settings.auth_cache_ttl_seconds
+)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
@@ -48,36 +48,130 @@ def verify_token(token: str) -> dict:
         )
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user from JWT token"""
-    token = credentials.credentials
+def get_user_by_email(email: str, db: Session) -> Optional[User]:
+    """Load user by email"""
+    return db.query(User).filter(User.email == email).first()
+
+
+def _token_payload(token: str) -> dict:
+    """Decode bearer token and make sure it names a subject (user email)"""
     payload = verify_token(token)
-    user_email = payload.get("sub")
     
-    if user_email is None:
+    if payload.get("sub") is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
-    
-    user = db.query(User).filter(User.email == user_email).first()
+    return payload
+
+
+def _require_user(user: Optional[User]) -> User:
+    """Reject tokens whose user no longer exists"""
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
+    return user
+
+
+def _load_principal(user_email: str, db: Session) -> Optional[User]:
+    """Load user detached from the session so it can outlive the request.
+    
+    The user's version stamp is read in the same query and kept as
+    principal_version, so conditional GETs can tell a stale cached copy.
+    """
+    row = (
+        db.query(User, UserVersion.version)
+        .outerjoin(UserVersion, UserVersion.user_id == User.id)
+        .filter(User.email == user_email)
+        .first()
+    )
+    if row is None:
+        return None
+    user, version = row
+    db.expunge(user)
+    user.principal_version = version or 0
+    return user
+
+
+async def refresh_principal(user: User, db) -> int:
+    """Reload a cached principal in place, returns the version it now reflects.
+    
+    Updating the shared instance refreshes the cache entry and the
+    current_user the route already holds.
+    """
+    fresh = _require_user(await run_db(db, _load_principal, user.email))
+    for column in User.__table__.columns:
+        setattr(user, column.key, getattr(fresh, column.key))
+    user.principal_version = fresh.principal_version
+    return user.principal_version
+
+
+def _cache_principal(token: str, payload: dict, user: User):
+    """Cache user for token, never past the token's own expiry"""
+    exp = payload.get("exp")
+    ttl = exp - time.time() if exp is not None else None
+    principal_cache.set(token, user, ttl=ttl)
+
+
+def invalidate_principal(user_id: int):
+    """Drop cached principals of a user after its row changed"""
+    principal_cache.discard_where(lambda user: user.id == user_id)
+
+
+def get_current_user_sync(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    """Get current authenticated user from JWT token"""
+    token = credentials.credentials
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
     
+    payload = _token_payload(token)
+    user = _require_user(_load_principal(payload["sub"], db))
+    _cache_principal(token, payload, user)
     return user
 
 
-def authenticate_user(email: str, password: str, db: Session) -> User:
-    """Authenticate user with email and password"""
-    user = db.query(User).filter(User.email == email).first()
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Get current authenticated user from JWT token (async session mode)"""
+    token = credentials.credentials
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+    
+    payload = _token_payload(token)
+    user = _require_user(await run_db(db, _load_principal, payload["sub"]))
+    _cache_principal(token, payload, user)
+    return user
+
+
+# Dependency for the configured session mode
+get_current_user = get_current_user_async if settings.db_mode == "async" else get_current_user_sync
+
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Require the current user to be listed in ADMIN_EMAILS"""
+    admins = {email.strip().lower() for email in settings.admin_emails.split(",") if email.strip()}
+    if current_user.email.lower() not in admins:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+
+async def authenticate_user(email: str, password: str, db) -> User:
+    """Authenticate user with email and password (bcrypt runs on the hashing pool)"""
+    user = await run_db(db, get_user_by_email, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await hashing_pool.verify(password, user.hashed_password):
         return None
     return user
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from prometheus_client import Counter
+
+# Prometheus metrics
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'In-process cache lookups',
+    ['cache', 'result']
+)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry.
+
+    Entries expire after ``ttl`` seconds or earlier when ``set`` is given a
+    shorter ttl, and the least recently used entry is evicted once
+    ``maxsize`` is reached.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels(cache=name, result="hit")
+        self._misses = CACHE_REQUESTS.labels(cache=name, result="miss")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return cached value or default when missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits.inc()
+                    return value
+                del self._data[key]
+        self._misses.inc()
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store value, ttl is capped at the cache ttl"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove and return a value"""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def discard_where(self, predicate: Callable[[Any], bool]):
+        """Remove every entry whose value matches predicate"""
+        with self._lock:
+            stale = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
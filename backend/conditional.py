@@ -0,0 +1,47 @@
+import hashlib
+from datetime import date
+from fastapi import Depends, HTTPException, Request, Response, status
+from auth import get_current_user, refresh_principal
+from database import get_session, run_db
+from models import User
+from services import VersionService
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the given parts"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db=Depends(get_session)
+):
+    """Answer If-None-Match with 304 before the route runs any service query.
+
+    The ETag covers the user's version stamp, today's date (streaks, weekly
+    windows and the quote change with it) and the request URL. A cached
+    principal older than the stamp (e.g. goals changed on another worker) is
+    reloaded first, so the body is never older than its ETag.
+    """
+    version = await run_db(db, VersionService.get_version, current_user.id)
+    if version != current_user.principal_version:
+        version = await refresh_principal(current_user, db)
+    etag = make_etag(current_user.id, version, date.today(), request.url.path, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
@@ -8,21 +8,90 @@ class Settings(BaseSettings):
 
     # Database - REQUIRED
     database_url: str
+    # Session mode: "sync" (psycopg2 Session) or "async" (asyncpg AsyncSession)
+    db_mode: str = "sync"
 
     # JWT - REQUIRED
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 10080  # 7 days
 
+    # Authenticated-principal cache
+    auth_cache_ttl_seconds: int = 60
+    auth_cache_max_entries: int = 10000
+
+    # Password hashing pool
+    hash_pool_workers: int = 0  # 0 = size from the container CPU quota
+    hash_queue_size: int = 32
+
     # Application
     upload_dir: str = "/app/uploads"
     max_upload_size: int = 5 * 1024 * 1024  # 5MB
+    max_image_pixels: int = 25_000_000  # decompression bomb guard, ~100MB decoded
+    history_max_page_size: int = 100
+    import_max_rows: int = 5000
+    import_max_bytes: int = 2 * 1024 * 1024  # 2MB, well above import_max_rows rows
+
+    # Idempotency-Key replay store: "memory" (per process) or "database" (shared)
+    idempotency_store: str = "memory"
+    idempotency_ttl_seconds: int = 86400
+    idempotency_max_entries: int = 10000
+
+    # Upload storage: "local" (UPLOAD_DIR) or "s3" (any S3-compatible bucket)
+    storage_backend: str = "local"
+    s3_bucket: str = ""
+    s3_prefix: str = "uploads"
+    s3_region: str = ""
+    s3_endpoint_url: str = ""  # e.g. http://minio:9000
+    s3_public_url: str = ""  # CDN or bucket URL avatars are served from
+    direct_upload_expires_seconds: int = 300
+
+    # Comma-separated emails allowed to use /api/admin endpoints
+    admin_emails: str = ""
 
     # CORS origins
     cors_origins: str = "http://localhost:3000,http://localhost:5173"
 
     # Quote API
     quote_api_url: str = "https://api.quotable.io/quotes/random?tags=wisdom"
+    quote_prefetch_interval_seconds: int = 3600
+    quote_breaker_failure_threshold: int = 3
+    quote_breaker_open_seconds: int = 60
+    quote_breaker_half_open_calls: int = 1
+
+    # Outbound HTTP
+    outbound_timeout_seconds: float = 5.0
+
+    # Connection pool, per process
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+
+    # Shed these route prefixes with a 503 once pool checkouts wait longer
+    # than shed_pool_wait_seconds (0 = never shed)
+    shed_pool_wait_seconds: float = 0.5
+    shed_path_prefixes: str = "/api/analytics,/api/check-in/history,/api/check-in/export,/api/admin"
+    shed_retry_after_seconds: int = 5
+
+    # Warn when a request runs more statements than this, 0 = off
+    db_query_budget: int = 0
+
+    # On-demand request profiling, see profiler.py. A request is profiled when
+    # its X-Profile-Token header matches profiler_token, or at profiler_sample_rate
+    profiler_enabled: bool = False
+    profiler_token: str = ""
+    profiler_sample_rate: float = 0.0
+    profiler_interval_seconds: float = 0.005
+    profiler_dir: str = "/tmp/profiles"
+    profiler_max_files: int = 200
+
+    # Request latency histogram buckets in seconds, comma-separated
+    metrics_latency_buckets: str = "0.005,0.01,0.025,0.05,0.075,0.1,0.25,0.5,0.75,1,2.5,5,7.5,10"
+
+    # Log records buffered for the writer thread, extra records are dropped
+    log_queue_size: int = 10000
+    # Fraction of successful, fast requests that get an access log line
+    access_log_sample_rate: float = 1.0
+    access_log_slow_seconds: float = 1.0
 
     # Logging level - will be set based on env in __init__
     log_level: str = "INFO"
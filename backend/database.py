@@ -1,12 +1,54 @@
-from sqlalchemy import create_engine, Index, text
+from sqlalchemy import create_engine, event, Index, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from config import settings
-from models import Base, CheckIn, DailyQuote
+from models import Base, CheckIn, DailyQuote, User
+from pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class QueryStats:
+    """Statements, time spent in the database and rows for one request"""
+
+    __slots__ = ("queries", "duration", "rows")
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.rows = 0
+
+
+# Set by the request middleware, statements run outside a request are not counted
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's context, a failed statement never reaches the after hook
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = context._query_start
+    stats = query_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.duration += time.perf_counter() - start
+        # -1 when the driver does not know, e.g. server-side cursors
+        stats.rows += max(cursor.rowcount, 0)
+
+
+def instrument_engine(engine):
+    """Attribute every statement on engine to the current request's QueryStats"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
 def create_db_engine():
     """Create database engine with retry logic"""
     max_retries = 5
@@ -17,9 +59,10 @@ def create_db_engine():
             logger.info(f"Attempting to connect to database (attempt {attempt + 1}/{max_retries})")
             engine = create_engine(
                 settings.database_url,
+                poolclass=InstrumentedQueuePool,
                 pool_pre_ping=True,
-                pool_size=10,
-                max_overflow=20,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
                 connect_args={'connect_timeout': 10}
             )
             # Test connection with text() wrapper
@@ -36,9 +79,29 @@ def create_db_engine():
                 logger.error("Max retries reached. Unable to connect to database.")
                 raise
 
+def create_async_db_engine():
+    """Create asyncpg-backed engine for async session mode"""
+    url = make_url(settings.database_url).set(drivername="postgresql+asyncpg")
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_pre_ping=True,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        connect_args={'timeout': 10}
+    )
+
 # Create engine with retry
 engine = create_db_engine()
 
+# Async engine is only built when requested, the sync engine above still
+# serves table creation and anything run outside a request
+async_engine = create_async_db_engine() if settings.db_mode == "async" else None
+
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
 # Create unique index for check_ins
 Index('idx_user_check_in_date', CheckIn.user_id, CheckIn.check_in_date, unique=True)
 
@@ -53,6 +116,52 @@ def get_db():
     finally:
         db.close()
 
+# Objects must stay readable after commit without lazy IO on the event loop
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+) if async_engine is not None else None
+
+async def get_async_db():
+    """Dependency for getting async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Session dependency for the configured mode
+get_session = get_async_db if settings.db_mode == "async" else get_db
+
+def session_pool():
+    """Connection pool behind get_session (engine.dispose() replaces it)"""
+    if async_engine is not None:
+        return async_engine.sync_engine.pool
+    return engine.pool
+
+@asynccontextmanager
+async def open_session():
+    """Open a session of the configured mode outside of a request"""
+    if settings.db_mode == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run a sync service call against either session type.
+
+    With an AsyncSession the call goes through run_sync, so each statement
+    awaits asyncpg instead of blocking the event loop. Both modes therefore
+    execute the same service code and the same SQL.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(lambda session: fn(*args, db=session, **kwargs))
+    return fn(*args, db=db, **kwargs)
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes added to tables that already exist
+    for index in User.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
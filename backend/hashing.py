@@ -0,0 +1,126 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+from config import settings
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Prometheus metrics
+HASH_QUEUE_DEPTH = Gauge(
+    'password_hash_queue_depth',
+    'Password hash jobs queued or running on the hashing pool',
+    multiprocess_mode='livesum'
+)
+
+HASH_WAIT_TIME = Histogram(
+    'password_hash_wait_seconds',
+    'Time a password hash job waits before a worker picks it up'
+)
+
+HASH_REJECTED = Counter(
+    'password_hash_rejected_total',
+    'Password hash jobs rejected because the hashing queue was full'
+)
+
+
+def _hash_job(password: str) -> tuple:
+    """Worker side of hash, returns (start time, hash)"""
+    return time.time(), pwd_context.hash(password)
+
+
+def _verify_job(plain_password: str, hashed_password: str) -> tuple:
+    """Worker side of verify, returns (start time, result)"""
+    return time.time(), pwd_context.verify(plain_password, hashed_password)
+
+
+def cpu_quota() -> int:
+    """Number of CPUs granted by the cgroup limit, falling back to the host count"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    return os.cpu_count() or 1
+
+
+class HashingPool:
+    """Process pool for bcrypt with a bounded queue.
+
+    Jobs beyond workers + queue_size are rejected with a 503 instead of
+    piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers or cpu_quota()
+        self.queue_size = queue_size
+        self._executor = None
+        self._pending = 0
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.workers + self.queue_size:
+            HASH_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"}
+            )
+
+        self.start()
+        self._pending += 1
+        HASH_QUEUE_DEPTH.inc()
+        submitted = time.time()
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, fn, *args
+            )
+        finally:
+            self._pending -= 1
+            HASH_QUEUE_DEPTH.dec()
+
+        HASH_WAIT_TIME.observe(max(0.0, started - submitted))
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Hash a password on the pool"""
+        return await self._submit(_hash_job, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password on the pool"""
+        return await self._submit(_verify_job, plain_password, hashed_password)
+
+
+hashing_pool = HashingPool(settings.hash_pool_workers, settings.hash_queue_size)
@@ -0,0 +1,248 @@
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from prometheus_client import Counter
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from cache import TTLCache
+from config import settings
+from database import open_session, run_db
+from models import IdempotencyRecord
+
+# Prometheus metrics
+IDEMPOTENCY_REQUESTS = Counter(
+    'idempotency_requests_total',
+    'Requests carrying an Idempotency-Key',
+    ['result']
+)
+
+# A reservation left behind by a crashed worker stops blocking the key after this
+IN_FLIGHT_SECONDS = 60
+
+# Responses larger than this are not kept for replay
+MAX_STORED_BODY = 1024 * 1024
+
+
+class MemoryIdempotencyStore:
+    """Per-process store on an LRU cache, replays only reach the same worker"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache("idempotency", maxsize, ttl)
+        self._lock = threading.Lock()
+
+    async def reserve(self, key: str) -> Optional[dict]:
+        """Claim key, returns the existing record if someone already has it"""
+        with self._lock:
+            record = self._cache.get(key)
+            if record is None:
+                self._cache.set(key, {"status_code": None}, ttl=IN_FLIGHT_SECONDS)
+            return record
+
+    async def complete(self, key: str, record: dict):
+        self._cache.set(key, record)
+
+    async def release(self, key: str):
+        self._cache.pop(key)
+
+
+class DatabaseIdempotencyStore:
+    """Store in the idempotency_keys table, shared by every worker and replica"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @staticmethod
+    def _reserve(key: str, db: Session) -> Optional[dict]:
+        now = datetime.utcnow()
+        db.execute(
+            delete(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key, IdempotencyRecord.expires_at <= now)
+        )
+        claimed = db.execute(
+            insert(IdempotencyRecord)
+            .values(key=key, expires_at=now + timedelta(seconds=IN_FLIGHT_SECONDS))
+            .on_conflict_do_nothing(index_elements=[IdempotencyRecord.key])
+            .returning(IdempotencyRecord.key)
+        ).first()
+        record = None
+        if claimed is None:
+            row = db.get(IdempotencyRecord, key)
+            if row is not None:
+                record = {
+                    "status_code": row.status_code,
+                    "headers": row.headers,
+                    "body": row.body,
+                    "fingerprint": row.fingerprint
+                }
+        db.commit()
+        return record
+
+    @staticmethod
+    def _complete(key: str, record: dict, ttl: float, db: Session):
+        db.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key)
+            .values(**record, expires_at=datetime.utcnow() + timedelta(seconds=ttl))
+        )
+        db.commit()
+
+    @staticmethod
+    def _release(key: str, db: Session):
+        db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key == key))
+        db.commit()
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """Delete expired keys, returns rows removed"""
+        result = db.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+
+    async def reserve(self, key: str) -> Optional[dict]:
+        async with open_session() as db:
+            return await run_db(db, self._reserve, key)
+
+    async def complete(self, key: str, record: dict):
+        async with open_session() as db:
+            await run_db(db, self._complete, key, record, self.ttl)
+
+    async def release(self, key: str):
+        async with open_session() as db:
+            await run_db(db, self._release, key)
+
+
+def create_store():
+    """Store for the configured IDEMPOTENCY_STORE"""
+    if settings.idempotency_store == "database":
+        return DatabaseIdempotencyStore(settings.idempotency_ttl_seconds)
+    return MemoryIdempotencyStore(settings.idempotency_max_entries, settings.idempotency_ttl_seconds)
+
+
+class IdempotencyMiddleware:
+    """Replay the stored response for a repeated Idempotency-Key.
+
+    Keys are scoped to the caller's Authorization header and the route, so
+    a replay skips auth, services and upload processing entirely. Non-multipart
+    bodies are hashed as the app reads them, and a replay whose body differs
+    gets a 422. A key that is still being processed gets a 409. 5xx responses
+    are not stored, so those requests can be retried.
+    """
+
+    def __init__(self, app, paths, store=None):
+        self.app = app
+        self.paths = set(paths)
+        self.store = store or create_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > 255:
+            response = JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)
+            await response(scope, receive, send)
+            return
+
+        key = hashlib.sha256("\n".join([
+            headers.get("authorization", ""), scope["method"], scope["path"], idempotency_key
+        ]).encode()).hexdigest()
+
+        record = await self.store.reserve(key)
+        if record is not None:
+            await self._replay(record, scope, receive, send)
+            return
+
+        # Hash the body as the app consumes it, without buffering it. Multipart
+        # boundaries are regenerated on every retry, so those bodies never match.
+        body_hash = hashlib.sha256(scope.get("query_string", b""))
+        body_read = False
+        fingerprinted = not headers.get("content-type", "").startswith("multipart/")
+
+        async def hashing_receive():
+            nonlocal body_read
+            message = await receive()
+            if message["type"] == "http.request":
+                body_hash.update(message.get("body", b""))
+                body_read = not message.get("more_body", False)
+            return message
+
+        start = None
+        chunks = []
+        size = 0
+
+        async def recording_send(message):
+            nonlocal start, size
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= MAX_STORED_BODY:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, hashing_receive, recording_send)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+        if start is None or start["status"] >= 500 or size > MAX_STORED_BODY:
+            await self.store.release(key)
+            IDEMPOTENCY_REQUESTS.labels(result="not_stored").inc()
+            return
+
+        await self.store.complete(key, {
+            "status_code": start["status"],
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in start["headers"]],
+            "body": b"".join(chunks),
+            # Only comparable when the app read the whole body
+            "fingerprint": body_hash.hexdigest() if fingerprinted and body_read else None
+        })
+        IDEMPOTENCY_REQUESTS.labels(result="stored").inc()
+
+    async def _replay(self, record: dict, scope, receive, send):
+        if record["status_code"] is None:
+            IDEMPOTENCY_REQUESTS.labels(result="in_flight").inc()
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                status_code=409,
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        if record["fingerprint"] is not None:
+            body_hash = hashlib.sha256(scope.get("query_string", b""))
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                body_hash.update(message.get("body", b""))
+                more_body = message.get("more_body", False)
+            if body_hash.hexdigest() != record["fingerprint"]:
+                IDEMPOTENCY_REQUESTS.labels(result="mismatch").inc()
+                response = JSONResponse(
+                    {"detail": "Idempotency-Key was already used with a different request"},
+                    status_code=422
+                )
+                await response(scope, receive, send)
+                return
+
+        IDEMPOTENCY_REQUESTS.labels(result="replayed").inc()
+        response = Response(record["body"], status_code=record["status_code"])
+        response.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]
+        ] + [(b"idempotent-replayed", b"true")]
+        await response(scope, receive, send)
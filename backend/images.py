@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.staticfiles import StaticFiles
+from config import settings
+from hashing import cpu_quota
+from storage import IMMUTABLE_CACHE_CONTROL, storage
+
+# Square bounding boxes rendered for every avatar, and the formats written
+AVATAR_SIZES = (64, 128, 500)
+AVATAR_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+AVATAR_CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# Pillow's own decompression bomb check, a backstop for the explicit one below
+Image.MAX_IMAGE_PIXELS = settings.max_image_pixels
+
+# Decoding and resizing release the GIL, so a thread per CPU keeps them off the loop
+_image_pool = ThreadPoolExecutor(max_workers=cpu_quota(), thread_name_prefix="images")
+
+
+def _too_large(detail: Optional[str] = None) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=detail or f"File too large (max {settings.max_upload_size // (1024 * 1024)}MB)"
+    )
+
+
+class UploadLimitMiddleware:
+    """Reject oversized upload bodies before they are parsed or spooled.
+
+    A Content-Length over the limit is refused without reading the body,
+    and chunked bodies are cut off as soon as they pass it.
+    """
+
+    def __init__(self, app, paths, max_bytes: int, detail: Optional[str] = None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            exc = _too_large(self.detail)
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _too_large(self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """Read an upload in chunks, stopping as soon as it passes max_bytes"""
+    chunks = []
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def content_stem(data: bytes) -> str:
+    """Name for an avatar derived from its bytes, so identical uploads share files"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for never-overwritten names, cacheable forever without revalidation"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def _render_avatar(data: bytes) -> dict:
+    """Decode once and encode every size and format, returns {suffix: bytes}"""
+    with Image.open(io.BytesIO(data)) as image:
+        # Opening only parses the header, so check the size before decoding pixels
+        width, height = image.size
+        if width * height > settings.max_image_pixels:
+            raise ValueError("Image dimensions too large")
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = {}
+        for size in sorted(AVATAR_SIZES, reverse=True):
+            # Each size is downscaled from the previous, larger one
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for ext, fmt in AVATAR_FORMATS.items():
+                variant = image if fmt != "JPEG" or image.mode == "RGB" else image.convert("RGB")
+                buffer = io.BytesIO()
+                variant.save(buffer, fmt, optimize=True, quality=85)
+                variants[f"{size}.{ext}"] = buffer.getvalue()
+        return variants
+
+
+def _store_avatar(data: bytes, stem: str) -> list:
+    """Render and store every variant, returns the object names"""
+    names = avatar_files(stem)
+    # Variants are stored in this order, so the last one marks a complete set
+    if storage.exists(names[-1]):
+        # Same image uploaded before, nothing to decode
+        return names
+
+    try:
+        variants = _render_avatar(data)
+    except Exception as e:
+        # Rendering only touches the upload's bytes in memory, so any failure
+        # (SyntaxError and struct.error from bad chunks too) is a bad image
+        raise ValueError("Invalid image file") from e
+    for suffix, body in variants.items():
+        storage.put(f"{stem}-{suffix}", body, AVATAR_CONTENT_TYPES[suffix.split(".")[1]])
+    return names
+
+
+async def render_avatar(data: bytes, stem: str) -> list:
+    """Store the avatar variants from the image pool, raises ValueError for bad images"""
+    return await asyncio.get_running_loop().run_in_executor(_image_pool, _store_avatar, data, stem)
+
+
+async def delete_avatar(profile_picture: str):
+    """Delete every stored file of a profile picture"""
+    def delete():
+        # The last variant marks a complete set, so it goes first
+        for name in reversed(avatar_files(profile_picture)):
+            storage.delete(name)
+    await asyncio.get_running_loop().run_in_executor(_image_pool, delete)
+
+
+def avatar_files(profile_picture: str) -> list:
+    """Every file stored for a profile picture (older pictures are a single file)"""
+    if "." in profile_picture:
+        return [profile_picture]
+    return [
+        f"{profile_picture}-{size}.{ext}"
+        for size in sorted(AVATAR_SIZES, reverse=True) for ext in AVATAR_FORMATS
+    ]
+
+
+def avatar_urls(profile_picture: str) -> dict:
+    """URL of each rendered variant, keyed like '128.webp'"""
+    return {
+        f"{size}.{ext}": storage.url(f"{profile_picture}-{size}.{ext}")
+        for size in AVATAR_SIZES for ext in AVATAR_FORMATS
+    }
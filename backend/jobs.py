@@ -0,0 +1,93 @@
+"""Maintenance commands, run as: python jobs.py <command>"""
+import argparse
+import logging
+from database import SessionLocal, init_db
+from models import User
+from services import DashboardService, StreakService, RollupService, ActivityService
+from idempotency import DatabaseIdempotencyStore
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild_dashboard_snapshots(batch_size: int = 500):
+    """Recompute every user's dashboard snapshot from streaks and check-ins"""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id)]
+        for i, user_id in enumerate(user_ids, start=1):
+            db.merge(DashboardService.build_snapshot(user_id, db))
+            if i % batch_size == 0:
+                db.commit()
+        db.commit()
+        logger.info(f"Rebuilt {len(user_ids)} dashboard snapshots")
+    finally:
+        db.close()
+
+
+def reset_stale_streaks():
+    """Nightly: zero out streaks whose last check-in is older than yesterday"""
+    db = SessionLocal()
+    try:
+        count = StreakService.reset_stale_streaks(db)
+        logger.info(f"Reset {count} stale streaks")
+    finally:
+        db.close()
+
+
+def rebuild_rollups():
+    """Recompute weekly and monthly rollups for every user (backfills)"""
+    db = SessionLocal()
+    try:
+        users = db.query(User).order_by(User.id).all()
+        for user in users:
+            RollupService.rebuild_user(user, db)
+            db.commit()
+        logger.info(f"Rebuilt rollups for {len(users)} users")
+    finally:
+        db.close()
+
+
+def rebuild_activity_bitmaps():
+    """Recompute every user's activity calendar bitmaps from check-ins"""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id)]
+        for user_id in user_ids:
+            ActivityService.rebuild_user(user_id, db)
+            db.commit()
+        logger.info(f"Rebuilt activity bitmaps for {len(user_ids)} users")
+    finally:
+        db.close()
+
+
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key records (IDEMPOTENCY_STORE=database)"""
+    db = SessionLocal()
+    try:
+        count = DatabaseIdempotencyStore.purge_expired(db)
+        logger.info(f"Purged {count} expired idempotency keys")
+    finally:
+        db.close()
+
+
+COMMANDS = {
+    "rebuild-dashboard-snapshots": rebuild_dashboard_snapshots,
+    "reset-stale-streaks": reset_stale_streaks,
+    "rebuild-rollups": rebuild_rollups,
+    "rebuild-activity-bitmaps": rebuild_activity_bitmaps,
+    "purge-idempotency-keys": purge_idempotency_keys,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consigliere maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
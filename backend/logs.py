@@ -0,0 +1,131 @@
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from prometheus_client import Counter, Gauge
+from config import settings
+
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:
+    import json
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, default=str)
+
+# Prometheus metrics
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total',
+    'Log records dropped because the log queue was full',
+    ['level']
+)
+
+LOG_QUEUE_DEPTH = Gauge(
+    'log_queue_depth',
+    'Log records waiting for the writer thread',
+    multiprocess_mode='livesum'
+)
+
+# Set by setup_logging, stopped at exit so queued records are flushed
+_listener: Optional[QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        log_entry: Dict[str, Any] = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        if hasattr(record, 'request_id'):
+            log_entry["request_id"] = record.request_id
+
+        if record.exc_info:
+            log_entry["exception"] = self.formatException(record.exc_info)
+
+        # Add extra fields if present
+        if hasattr(record, 'extra_fields'):
+            log_entry.update(record.extra_fields)
+
+        return _dumps(log_entry)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hand records to the writer thread without formatting or blocking.
+
+    Formatting and the stderr write happen on the listener thread. When the
+    bounded queue is full the record is dropped and counted instead of
+    stalling the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now, since args may change after the call returns.
+        # exc_info stays on the record, the listener runs in this process.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(level=record.levelname).inc()
+        LOG_QUEUE_DEPTH.set(self.queue.qsize())
+
+
+class DepthQueueListener(QueueListener):
+    """QueueListener that keeps log_queue_depth current as it drains"""
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        record = super().dequeue(block)
+        LOG_QUEUE_DEPTH.set(self.queue.qsize())
+        return record
+
+
+def sample_access_log(status_code: int, duration: float) -> bool:
+    """Whether to write the access log line for a finished request.
+
+    Errors and slow requests are always kept, the rest at ACCESS_LOG_SAMPLE_RATE.
+    """
+    if status_code >= 400 or duration >= settings.access_log_slow_seconds:
+        return True
+    return settings.access_log_sample_rate >= 1 or random.random() < settings.access_log_sample_rate
+
+
+def setup_logging():
+    """Configure structured JSON logging through a background writer thread"""
+    global _listener
+    logger = logging.getLogger()
+    logger.setLevel(getattr(logging, settings.log_level.upper(), logging.INFO))
+
+    # Remove existing handlers
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    _stop_listener()
+
+    # The listener thread owns the console handler, callers only enqueue
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter())
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    _listener = DepthQueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(DroppingQueueHandler(log_queue))
+
+    # Set specific loggers
+    logging.getLogger("uvicorn").setLevel(logging.WARNING)
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)  # We'll handle access logs ourselves
+
+
+@atexit.register
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
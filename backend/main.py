@@ -1,95 +1,23 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from contextlib import asynccontextmanager
+import asyncio
+import csv
+import io
 import os
 import uuid
 from pathlib import Path
-from PIL import Image
 import logging
 import json
-from typing import Any, Dict
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-
-
-# Prometheus metrics
-REQUEST_COUNT = Counter(
-    'http_requests_total',
-    'Total number of HTTP requests',
-    ['method', 'endpoint', 'status_code']
-)
-
-REQUEST_LATENCY = Histogram(
-    'http_request_duration_seconds',
-    'HTTP request duration in seconds',
-    ['method', 'endpoint']
-)
-
-DAILY_CHECKINS = Counter(
-    'consigliere_daily_checkins_total',
-    'Total number of daily check-ins recorded',
-)
-
-ACTIVE_CONNECTIONS = Gauge(
-    'active_connections',
-    'Number of active connections'
-)
-
-DAILY_CHECKINS = Counter(
-    'daily_checkins_total',
-    'Total number of daily check-ins'
-)
-
-ERROR_COUNT = Counter(
-    'errors_total',
-    'Total number of errors',
-    ['type', 'endpoint']
-)
-
-
-# Configure structured logging
-class StructuredFormatter(logging.Formatter):
-    def format(self, record: logging.LogRecord) -> str:
-        log_entry: Dict[str, Any] = {
-            "timestamp": self.formatTime(record),
-            "level": record.levelname,
-            "logger": record.name,
-            "message": record.getMessage(),
-        }
-
-        if hasattr(record, 'request_id'):
-            log_entry["request_id"] = record.request_id
-
-        if record.exc_info:
-            log_entry["exception"] = self.formatException(record.exc_info)
-
-        # Add extra fields if present
-        if hasattr(record, 'extra_fields'):
-            log_entry.update(record.extra_fields)
-
-        return json.dumps(log_entry)
-
-
-def setup_logging():
-    """Configure structured JSON logging"""
-    logger = logging.getLogger()
-    logger.setLevel(getattr(logging, settings.log_level.upper(), logging.INFO))
-
-    # Remove existing handlers
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-
-    # Create console handler with structured formatter
-    handler = logging.StreamHandler()
-    handler.setFormatter(StructuredFormatter())
-    logger.addHandler(handler)
-
-    # Set specific loggers
-    logging.getLogger("uvicorn").setLevel(logging.WARNING)
-    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)  # We'll handle access logs ourselves
+from typing import List
+from prometheus_client import CONTENT_TYPE_LATEST
 
 
 # Custom middleware for request logging and error handling
@@ -107,75 +35,186 @@ class RequestLoggingMiddleware:
 
         # Log request
         logger = logging.getLogger("request")
-        logger.info(
-            f"Incoming {scope['method']} {scope['path']}",
-            extra={"extra_fields": {"method": scope["method"], "path": scope["path"]}, "request_id": request_id}
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Incoming {scope['method']} {scope['path']}",
+                extra={"extra_fields": {"method": scope["method"], "path": scope["path"]}, "request_id": request_id}
+            )
 
         # Store request_id in scope for later use
         scope["request_id"] = request_id
 
-        # Track start time
+        # Track start time, and the path before any mount rewrites it
         start_time = datetime.utcnow()
+        path = scope["path"]
+        ACTIVE_CONNECTIONS.inc()
+
+        # Statements run while handling this request, see database.instrument_engine
+        stats = QueryStats()
+        stats_token = query_stats.set(stats)
 
         # Custom send function to log response
         original_send = send
+        response_start = None
 
         async def logging_send(message):
+            nonlocal response_start
             if message["type"] == "http.response.start":
                 status_code = message["status"]
                 duration = (datetime.utcnow() - start_time).total_seconds()
+                endpoint = route_template(scope, path)
+                response_start = (status_code, duration, endpoint)
 
                 # Record metrics
                 REQUEST_COUNT.labels(
                     method=scope["method"],
-                    endpoint=scope["path"],
+                    endpoint=endpoint,
                     status_code=str(status_code)
                 ).inc()
 
                 REQUEST_LATENCY.labels(
                     method=scope["method"],
-                    endpoint=scope["path"]
+                    endpoint=endpoint
                 ).observe(duration)
 
                 # Record errors
                 if status_code >= 400:
                     ERROR_COUNT.labels(
                         type="http_error",
-                        endpoint=scope["path"]
+                        endpoint=endpoint
                     ).inc()
 
-                logger.info(
-                    f"Response {status_code} in {duration:.2f}s",
-                    extra={"extra_fields": {"status_code": status_code, "duration": duration}, "request_id": request_id}
-                )
-
             await original_send(message)
 
-        await self.app(scope, receive, logging_send)
+        try:
+            await self.app(scope, receive, logging_send)
+        finally:
+            ACTIVE_CONNECTIONS.dec()
+            query_stats.reset(stats_token)
 
-from database import get_db, init_db
+        if response_start is None:
+            return
+        status_code, duration, endpoint = response_start
+
+        # DB stats are taken once the body is sent, streamed responses query while sending
+        DB_QUERIES.labels(endpoint=endpoint).observe(stats.queries)
+        DB_TIME.labels(endpoint=endpoint).observe(stats.duration)
+        DB_ROWS.labels(endpoint=endpoint).observe(stats.rows)
+
+        if 0 < settings.db_query_budget < stats.queries:
+            DB_QUERY_BUDGET_EXCEEDED.labels(endpoint=endpoint).inc()
+            logger.warning(
+                f"{scope['method']} {endpoint} ran {stats.queries} queries (budget {settings.db_query_budget})",
+                extra={"extra_fields": {
+                    "method": scope["method"],
+                    "endpoint": endpoint,
+                    "db_queries": stats.queries,
+                    "db_query_budget": settings.db_query_budget
+                }, "request_id": request_id}
+            )
+
+        # One line per request, successful fast ones are sampled
+        if logger.isEnabledFor(logging.INFO) and sample_access_log(status_code, duration):
+            logger.info(
+                f"{scope['method']} {path} {status_code} in {duration:.2f}s",
+                extra={"extra_fields": {
+                    "method": scope["method"],
+                    "path": path,
+                    "endpoint": endpoint,
+                    "status_code": status_code,
+                    "duration": duration,
+                    "db_queries": stats.queries,
+                    "db_time": round(stats.duration, 6),
+                    "db_rows": stats.rows
+                }, "request_id": request_id}
+            )
+
+from database import get_session, run_db, init_db, session_pool, QueryStats, query_stats
+from logs import setup_logging, sample_access_log
+from metrics import (
+    REQUEST_COUNT, REQUEST_LATENCY, ACTIVE_CONNECTIONS, DAILY_CHECKINS, ERROR_COUNT,
+    DB_QUERIES, DB_TIME, DB_ROWS, DB_QUERY_BUDGET_EXCEEDED,
+    route_template, generate_metrics, mark_worker_dead
+)
 from models import User
 from schemas import (
     UserRegister, UserLogin, TokenResponse, UserProfile, UserGoalsUpdate,
-    CheckInCreate, CheckInResponse, StreakResponse, QuoteResponse,
-    WeeklySummary, MonthlySummary, DashboardResponse
+    DirectUploadRequest, DirectUploadResponse, DirectUploadComplete,
+    CheckInCreate, CheckInResponse, CheckInHistoryItem, CheckInImportItem, CheckInImportResult, StreakResponse, QuoteResponse,
+    WeeklySummary, MonthlySummary, CalendarResponse, DashboardResponse
+)
+from auth import create_access_token, get_current_user, get_admin_user, authenticate_user, refresh_principal
+from hashing import hashing_pool
+from outbound import get_http_client, close_http_client
+from conditional import conditional_get
+from idempotency import IdempotencyMiddleware
+from pool import AdmissionControlMiddleware
+from profiler import PROFILE_SUFFIX, ProfilerMiddleware, list_profiles
+from images import (
+    MULTIPART_OVERHEAD, UploadLimitMiddleware, ImmutableStaticFiles, read_upload, content_stem, render_avatar,
+    delete_avatar, avatar_urls
+)
+from storage import IMMUTABLE_CACHE_CONTROL, LocalStorage, StorageError, storage
+from services import (
+    UserService, AvatarService, CheckInService, StreakService, DashboardService, QuoteService, AnalyticsService,
+    ActivityService, ExportService
 )
-from auth import create_access_token, get_current_user, authenticate_user
-from services import UserService, CheckInService, StreakService, QuoteService, AnalyticsService
 from config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown of app-wide resources"""
+    init_db()
+    hashing_pool.start()
+    get_http_client()
+    quote_prefetcher = asyncio.create_task(QuoteService.run_prefetcher())
+    yield
+    quote_prefetcher.cancel()
+    await close_http_client()
+    hashing_pool.shutdown()
+    mark_worker_dead()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Consigliere API",
     description="Daily learning tracker with discipline and consistency",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Setup logging
 setup_logging()
 
 # Add custom middleware
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths=["/api/user/profile-picture"],
+    max_bytes=settings.max_upload_size + MULTIPART_OVERHEAD
+)
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths=["/api/check-in/import"],
+    max_bytes=settings.import_max_bytes,
+    detail=f"Import body too large (max {settings.import_max_bytes // 1024}KB)"
+)
+app.add_middleware(IdempotencyMiddleware, paths=["/api/check-in", "/api/user/profile-picture"])
+app.add_middleware(
+    AdmissionControlMiddleware,
+    get_pool=session_pool,
+    prefixes=settings.shed_path_prefixes.split(","),
+    max_wait=settings.shed_pool_wait_seconds,
+    retry_after=settings.shed_retry_after_seconds
+)
+if settings.profiler_enabled:
+    app.add_middleware(
+        ProfilerMiddleware,
+        directory=settings.profiler_dir,
+        token=settings.profiler_token,
+        sample_rate=settings.profiler_sample_rate,
+        interval=settings.profiler_interval_seconds
+    )
 app.add_middleware(RequestLoggingMiddleware)
 
 # Global exception handler
@@ -193,12 +232,18 @@ async def global_exception_handler(request, exc):
         content={"detail": "Internal server error", "request_id": getattr(request.state, 'request_id', 'unknown')},
     )
 
-# Create upload directory
-UPLOAD_DIR = Path(settings.upload_dir)
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-# Mount uploads directory for serving images
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+# Serve uploads, names are never reused so browsers and proxies can cache them for good
+if isinstance(storage, LocalStorage):
+    app.mount("/uploads", ImmutableStaticFiles(directory=str(storage.directory)), name="uploads")
+else:
+    @app.get("/uploads/{name:path}", include_in_schema=False)
+    async def redirect_upload(name: str):
+        """Older /uploads links point at the bucket"""
+        return RedirectResponse(
+            storage.url(name),
+            status_code=status.HTTP_301_MOVED_PERMANENTLY,
+            headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
 
 # CORS middleware
 app.add_middleware(
@@ -207,15 +252,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed", "Retry-After"],
 )
 
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    init_db()
-
-
 # Health check endpoints
 @app.get("/health")
 async def health_check():
@@ -224,12 +264,11 @@ async def health_check():
 
 
 @app.get("/ready")
-async def readiness_check(db: Session = Depends(get_db)):
+async def readiness_check(db: Session = Depends(get_session)):
     """Readiness probe - checks if the app is ready to serve traffic"""
     try:
         # Check database connection
-        result = db.execute(text("SELECT 1"))
-        result.fetchone()
+        await run_db(db, lambda db: db.execute(text("SELECT 1")).fetchone())
         return {"status": "ready", "timestamp": datetime.utcnow().isoformat()}
     except Exception as e:
         error_logger = logging.getLogger("error")
@@ -240,20 +279,24 @@ async def readiness_check(db: Session = Depends(get_db)):
 @app.get("/metrics")
 async def metrics():
     """Prometheus metrics endpoint"""
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 
 # ============= AUTH ENDPOINTS =============
 
 @app.post("/api/auth/register", response_model=UserProfile, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: Session = Depends(get_session)):
     """Register a new user"""
     try:
-        user = UserService.create_user(
+        # Reject taken names before spending a bcrypt round on the hashing pool
+        await run_db(db, UserService.check_available, user_data.email, user_data.username)
+        hashed_password = await hashing_pool.hash(user_data.password)
+        user = await run_db(
+            db,
+            UserService.create_user,
             email=user_data.email,
             username=user_data.username,
-            password=user_data.password,
-            db=db
+            hashed_password=hashed_password
         )
         return user
     except ValueError as e:
@@ -261,9 +304,9 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @app.post("/api/auth/login", response_model=TokenResponse)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: Session = Depends(get_session)):
     """Login with email and password"""
-    user = authenticate_user(credentials.email, credentials.password, db)
+    user = await authenticate_user(credentials.email, credentials.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -283,59 +326,130 @@ async def get_profile(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+async def delete_unreferenced_avatar(stem: str, db):
+    """Delete an avatar's files if nothing references it any more.
+    
+    The stem is marked as being deleted rather than kept locked, so no row
+    lock is held across the await. An upload of the same image waits for the
+    marker to clear and then writes the files again.
+    """
+    if not await run_db(db, AvatarService.mark_deleting, stem):
+        return
+    try:
+        await delete_avatar(stem)
+    except Exception as e:
+        await run_db(db, AvatarService.unmark_deleting, stem)
+        logging.getLogger("error").warning(f"Could not delete avatar {stem}: {e}")
+        return
+    await run_db(db, AvatarService.forget, stem)
+
+
+async def set_profile_picture(contents: bytes, current_user: User, db) -> dict:
+    """Store an uploaded image's variants and point the user at them"""
+    # Files are shared by everyone who uploaded the same image. Reference the
+    # stem first, so a concurrent replacement cannot delete them under us.
+    stem = content_stem(contents)
+    while not await run_db(db, AvatarService.acquire, stem):
+        # Its files are being deleted, poll without holding the event loop
+        await asyncio.sleep(0.05)
+    
+    # Decode and resize off the event loop, unless this image is already stored
+    try:
+        await render_avatar(contents, stem)
+    except Exception as e:
+        if await run_db(db, AvatarService.abandon, stem):
+            await delete_unreferenced_avatar(stem, db)
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        raise
+    
+    # Update user, the old files go once nothing references them
+    unreferenced = await run_db(db, UserService.update_profile_picture, current_user, stem)
+    if unreferenced:
+        await delete_unreferenced_avatar(unreferenced, db)
+    
+    urls = avatar_urls(stem)
+    return {"filename": stem, "url": urls["500.webp"], "variants": urls}
+
+
 @app.post("/api/user/profile-picture")
 async def upload_profile_picture(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
-    """Upload profile picture"""
+    """Upload profile picture, stored as 64/128/500px WebP and JPEG variants"""
     # Validate file type
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Read file
-    contents = await file.read()
+    # Read file, stopping at the size limit
+    contents = await read_upload(file, settings.max_upload_size)
+    return await set_profile_picture(contents, current_user, db)
+
+
+@app.post("/api/user/profile-picture/upload-url", response_model=DirectUploadResponse)
+async def create_profile_picture_upload(
+    upload: DirectUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Presigned POST for uploading a profile picture straight to storage.
     
-    # Validate file size
-    if len(contents) > settings.max_upload_size:
-        raise HTTPException(status_code=400, detail="File too large (max 5MB)")
+    Post the file to `url` with `fields`, then call /complete with `key`.
+    Returns 400 when storage is local, use the multipart endpoint instead.
+    """
+    if not storage.supports_direct_upload:
+        raise HTTPException(status_code=400, detail="Direct uploads are not enabled")
     
-    # Generate unique filename
-    ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-    filename = f"{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
+    key = f"incoming/{current_user.id}/{uuid.uuid4().hex}"
+    presigned = await run_in_threadpool(
+        storage.presigned_upload,
+        key,
+        upload.content_type,
+        settings.max_upload_size,
+        settings.direct_upload_expires_seconds
+    )
+    return DirectUploadResponse(
+        key=key,
+        url=presigned["url"],
+        fields=presigned["fields"],
+        max_bytes=settings.max_upload_size,
+        expires_in=settings.direct_upload_expires_seconds
+    )
+
+
+@app.post("/api/user/profile-picture/complete")
+async def complete_profile_picture_upload(
+    upload: DirectUploadComplete,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_session)
+):
+    """Turn a finished direct upload into the user's profile picture"""
+    if not upload.key.startswith(f"incoming/{current_user.id}/") or ".." in upload.key:
+        raise HTTPException(status_code=400, detail="Unknown upload")
     
-    # Process and save image
     try:
-        image = Image.open(file.file)
-        # Resize to max 500x500 while maintaining aspect ratio
-        image.thumbnail((500, 500), Image.Resampling.LANCZOS)
-        image.save(filepath, optimize=True, quality=85)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid image file")
-    
-    # Delete old profile picture if exists
-    if current_user.profile_picture:
-        old_path = UPLOAD_DIR / current_user.profile_picture
-        if old_path.exists():
-            old_path.unlink()
+        contents = await run_in_threadpool(storage.get, upload.key, settings.max_upload_size)
+    except StorageError:
+        raise HTTPException(status_code=400, detail="Upload not found or too large")
     
-    # Update user
-    UserService.update_profile_picture(current_user, filename, db)
-    
-    return {"filename": filename, "url": f"/uploads/{filename}"}
+    try:
+        return await set_profile_picture(contents, current_user, db)
+    finally:
+        await run_in_threadpool(storage.delete, upload.key)
 
 
 @app.put("/api/user/goals", response_model=UserProfile)
 async def update_goals(
     goals: UserGoalsUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Update user's daily goals"""
-    UserService.update_goals(current_user, goals.pages_goal, goals.videos_goal, db)
-    return current_user
+    user = await run_db(db, UserService.update_goals, current_user, goals.pages_goal, goals.videos_goal)
+    # Requests still holding the cached principal see the new goals too
+    await refresh_principal(current_user, db)
+    return user
 
 
 # ============= CHECK-IN ENDPOINTS =============
@@ -344,16 +458,17 @@ async def update_goals(
 async def create_check_in(
     check_in_data: CheckInCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Create today's check-in (once per day, immutable)"""
     try:
-        check_in = CheckInService.create_check_in(
+        check_in = await run_db(
+            db,
+            CheckInService.create_check_in,
             user=current_user,
             pages_read=check_in_data.pages_read,
             videos_watched=check_in_data.videos_watched,
-            notes=check_in_data.notes,
-            db=db
+            notes=check_in_data.notes
         )
         # Record daily check-in metric
         DAILY_CHECKINS.inc()
@@ -365,10 +480,10 @@ async def create_check_in(
 @app.get("/api/check-in/today", response_model=CheckInResponse)
 async def get_today_check_in(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Get today's check-in"""
-    check_in = CheckInService.get_today_check_in(current_user.id, db)
+    check_in = await run_db(db, CheckInService.get_today_check_in, current_user.id)
     if not check_in:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -377,42 +492,122 @@ async def get_today_check_in(
     return check_in
 
 
-@app.get("/api/check-in/history", response_model=list[CheckInResponse])
+@app.get(
+    "/api/check-in/history",
+    response_model=list[CheckInHistoryItem],
+    response_model_exclude_unset=True,
+    dependencies=[Depends(conditional_get)]
+)
 async def get_check_in_history(
-    limit: int = 30,
+    response: Response,
+    limit: int = Query(30, ge=1),
+    cursor: str = None,
+    fields: str = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
-    """Get check-in history"""
-    check_ins = CheckInService.get_user_check_ins(current_user.id, limit, db)
+    """Get check-in history, newest first.
+    
+    Pass the X-Next-Cursor response header back as `cursor` for the next
+    page. `fields` is a comma-separated projection, e.g. fields=check_in_date,pages_read.
+    """
+    try:
+        check_ins, next_cursor = await run_db(
+            db,
+            CheckInService.get_user_check_ins,
+            current_user.id,
+            min(limit, settings.history_max_page_size),
+            cursor=cursor,
+            fields=[name.strip() for name in fields.split(",") if name.strip()] if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return check_ins
 
 
+@app.post("/api/check-in/import", response_model=CheckInImportResult)
+async def import_check_ins(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_session)
+):
+    """Backfill past check-ins from a JSON array or a text/csv body.
+    
+    Rows need check_in_date, pages_read and videos_watched, notes is optional.
+    Days that already have a check-in are skipped.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            rows = [{key: value or None for key, value in row.items()} for row in reader]
+        else:
+            rows = json.loads(body)
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not parse import body")
+    
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a list of check-ins")
+    if len(rows) > settings.import_max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Import is limited to {settings.import_max_rows} rows"
+        )
+    
+    # Validate every row up front so nothing is written for a bad file
+    try:
+        items = TypeAdapter(List[CheckInImportItem]).validate_python(rows)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+    
+    return await run_db(
+        db, CheckInService.import_check_ins, current_user, [item.model_dump() for item in items]
+    )
+
+
+def export_response(request: Request, user_id, fmt: str, filename: str) -> StreamingResponse:
+    """Stream an export, gzipped when the client accepts it"""
+    chunks = ExportService.stream_check_ins(user_id, fmt)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"',
+        "Vary": "Accept-Encoding"
+    }
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = ExportService.gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=ExportService.FORMATS[fmt], headers=headers)
+
+
+@app.get("/api/check-in/export")
+async def export_check_ins(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Download the full check-in history as NDJSON or CSV"""
+    return export_response(request, current_user.id, format, f"check-ins-{date.today()}")
+
+
 # ============= STREAK ENDPOINTS =============
 
-@app.get("/api/streak", response_model=StreakResponse)
+@app.get("/api/streak", response_model=StreakResponse, dependencies=[Depends(conditional_get)])
 async def get_streak(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Get current streak"""
-    streak = StreakService.get_streak(current_user.id, db)
-    
-    # Check if streak should be reset
-    if streak.last_check_in_date:
-        days_since_last = (date.today() - streak.last_check_in_date).days
-        if days_since_last > 1:
-            # Streak broken
-            streak.current_streak = 0
-            db.commit()
-    
-    return streak
+    return await run_db(db, StreakService.get_current_streak, current_user.id)
 
 
 # ============= QUOTE ENDPOINTS =============
 
 @app.get("/api/quote/today", response_model=QuoteResponse)
-async def get_daily_quote(db: Session = Depends(get_db)):
+async def get_daily_quote(db: Session = Depends(get_session)):
     """Get today's quote (same for all users)"""
     quote = await QuoteService.get_daily_quote(db)
     return quote
@@ -420,21 +615,21 @@ async def get_daily_quote(db: Session = Depends(get_db)):
 
 # ============= ANALYTICS ENDPOINTS =============
 
-@app.get("/api/analytics/weekly", response_model=WeeklySummary)
+@app.get("/api/analytics/weekly", response_model=WeeklySummary, dependencies=[Depends(conditional_get)])
 async def get_weekly_summary(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Get weekly summary"""
-    return AnalyticsService.get_weekly_summary(current_user, db)
+    return await run_db(db, AnalyticsService.get_weekly_summary, current_user)
 
 
-@app.get("/api/analytics/monthly", response_model=MonthlySummary)
+@app.get("/api/analytics/monthly", response_model=MonthlySummary, dependencies=[Depends(conditional_get)])
 async def get_monthly_summary(
-    month: int = None,
-    year: int = None,
+    month: int = Query(None, ge=1, le=12),
+    year: int = Query(None, ge=1, le=9998),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Get monthly summary"""
     if month is None or year is None:
@@ -442,30 +637,38 @@ async def get_monthly_summary(
         month = today.month
         year = today.year
     
-    return AnalyticsService.get_monthly_summary(current_user, month, year, db)
+    return await run_db(db, AnalyticsService.get_monthly_summary, current_user, month, year)
+
+
+@app.get("/api/analytics/calendar", response_model=CalendarResponse, dependencies=[Depends(conditional_get)])
+async def get_activity_calendar(
+    from_date: date = Query(None, alias="from"),
+    to_date: date = Query(None, alias="to"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_session)
+):
+    """Get check-in days and streak stats for a date range (defaults to the last year)"""
+    if to_date is None:
+        to_date = date.today()
+    if from_date is None:
+        from_date = to_date - timedelta(days=364)
+    
+    try:
+        return await run_db(db, ActivityService.get_calendar, current_user.id, from_date, to_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 # ============= DASHBOARD ENDPOINT =============
 
-@app.get("/api/dashboard", response_model=DashboardResponse)
+@app.get("/api/dashboard", response_model=DashboardResponse, dependencies=[Depends(conditional_get)])
 async def get_dashboard(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_session)
 ):
     """Get dashboard data (quote, streak, today's check-in status)"""
-    # Get today's check-in
-    today_check_in = CheckInService.get_today_check_in(current_user.id, db)
-    has_checked_in = today_check_in is not None
-    
-    # Get streak
-    streak = StreakService.get_streak(current_user.id, db)
-    
-    # Check if streak should be reset
-    if streak.last_check_in_date:
-        days_since_last = (date.today() - streak.last_check_in_date).days
-        if days_since_last > 1:
-            streak.current_streak = 0
-            db.commit()
+    # Streak and today's check-in come from the user's snapshot
+    dashboard = await run_db(db, DashboardService.get_dashboard, current_user.id)
     
     # Get daily quote
     quote_obj = await QuoteService.get_daily_quote(db)
@@ -475,12 +678,34 @@ async def get_dashboard(
         date=quote_obj.date
     )
     
-    return DashboardResponse(
-        has_checked_in_today=has_checked_in,
-        today_check_in=today_check_in,
-        streak=streak,
-        daily_quote=quote
-    )
+    return DashboardResponse(**dashboard, daily_quote=quote)
+
+
+# ============= ADMIN ENDPOINTS =============
+
+@app.get("/api/admin/check-ins/export")
+async def export_all_check_ins(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    admin: User = Depends(get_admin_user)
+):
+    """Download every user's check-ins as NDJSON or CSV (admins only)"""
+    return export_response(request, None, format, f"all-check-ins-{date.today()}")
+
+
+@app.get("/api/admin/profiles")
+async def get_profiles(admin: User = Depends(get_admin_user)):
+    """Request profiles written by the profiler, newest first (admins only)"""
+    return await run_in_threadpool(list_profiles, Path(settings.profiler_dir))
+
+
+@app.get("/api/admin/profiles/{name}")
+async def get_profile_file(name: str, admin: User = Depends(get_admin_user)):
+    """Download one profile as collapsed stacks, for flamegraph.pl or speedscope (admins only)"""
+    path = Path(settings.profiler_dir) / name
+    if "/" in name or not name.endswith(PROFILE_SUFFIX) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import os
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from starlette.routing import Match, Mount
+from config import settings
+
+# With several workers each process writes its samples to files in this
+# directory (set before prometheus_client is imported, see start.sh)
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = tuple(float(bucket) for bucket in settings.metrics_latency_buckets.split(","))
+
+# Prometheus metrics
+REQUEST_COUNT = Counter(
+    'http_requests_total',
+    'Total number of HTTP requests',
+    ['method', 'endpoint', 'status_code']
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request duration in seconds',
+    ['method', 'endpoint'],
+    buckets=LATENCY_BUCKETS
+)
+
+ACTIVE_CONNECTIONS = Gauge(
+    'active_connections',
+    'Number of requests currently being handled',
+    multiprocess_mode='livesum'
+)
+
+DAILY_CHECKINS = Counter(
+    'consigliere_daily_checkins_total',
+    'Total number of daily check-ins recorded',
+)
+
+ERROR_COUNT = Counter(
+    'errors_total',
+    'Total number of errors',
+    ['type', 'endpoint']
+)
+
+DB_QUERIES = Histogram(
+    'db_queries_per_request',
+    'SQL statements executed per request',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+)
+
+DB_TIME = Histogram(
+    'db_time_per_request_seconds',
+    'Time spent executing SQL per request in seconds',
+    ['endpoint'],
+    buckets=LATENCY_BUCKETS
+)
+
+DB_ROWS = Histogram(
+    'db_rows_per_request',
+    'Rows returned or affected by SQL per request',
+    ['endpoint'],
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+)
+
+DB_QUERY_BUDGET_EXCEEDED = Counter(
+    'db_query_budget_exceeded_total',
+    'Requests that ran more statements than DB_QUERY_BUDGET',
+    ['endpoint']
+)
+
+
+def route_template(scope, path: str) -> str:
+    """Path template of the route that handled the request, e.g. /api/analytics/monthly.
+
+    Labels must come from the finite set of routes, never the raw path, or
+    every avatar URL becomes its own time series.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+
+    # Mounts, and responses sent before routing (e.g. idempotent replays)
+    app = scope.get("app")
+    if app is not None:
+        for candidate in app.router.routes:
+            match, _ = candidate.matches({**scope, "path": path})
+            if match == Match.FULL:
+                return f"{candidate.path}/{{path}}" if isinstance(candidate, Mount) else candidate.path
+    return "unmatched"
+
+
+def generate_metrics() -> bytes:
+    """Exposition for this process, or for all workers in multiprocess mode"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_worker_dead():
+    """Drop this worker's live gauges when it shuts down"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
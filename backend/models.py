@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, Boolean, ForeignKey, Text, LargeBinary, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -13,7 +13,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    profile_picture = Column(String, nullable=True)  # Filename of uploaded image
+    profile_picture = Column(String, nullable=True, index=True)  # Avatar stem (older: filename)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     pages_goal = Column(Integer, default=10, nullable=False)
     videos_goal = Column(Integer, default=1, nullable=False)
@@ -52,6 +52,87 @@ class Streak(Base):
     user = relationship("User", back_populates="streaks")
 
 
+class ActivityBitmap(Base):
+    """One bit per day of a year, set when the user checked in that day"""
+    __tablename__ = "activity_bitmaps"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    # Bit n (byte n // 8, bit n % 8, as Postgres set_bit numbers it) is day-of-year n + 1
+    days = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class DashboardSnapshot(Base):
+    """Denormalized per-user dashboard state, maintained on check-in"""
+    __tablename__ = "dashboard_snapshots"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    current_streak = Column(Integer, default=0, nullable=False)
+    longest_streak = Column(Integer, default=0, nullable=False)
+    last_check_in_date = Column(Date, nullable=True)
+    # Copy of the latest check-in, today's check-in when its date is today
+    last_check_in_id = Column(Integer, nullable=True)
+    last_pages_read = Column(Integer, nullable=True)
+    last_videos_watched = Column(Integer, nullable=True)
+    last_notes = Column(Text, nullable=True)
+    last_check_in_created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class WeeklyRollup(Base):
+    """Per-user ISO week totals, maintained on check-in"""
+    __tablename__ = "weekly_rollups"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    iso_year = Column(Integer, primary_key=True)
+    iso_week = Column(Integer, primary_key=True)
+    days_checked_in = Column(Integer, default=0, nullable=False)
+    total_pages = Column(Integer, default=0, nullable=False)
+    total_videos = Column(Integer, default=0, nullable=False)
+    goal_hits = Column(Integer, default=0, nullable=False)
+    best_streak = Column(Integer, default=0, nullable=False)
+    # Run ending at last_check_in_date, needed to extend best_streak incrementally
+    current_run = Column(Integer, default=0, nullable=False)
+    last_check_in_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class MonthlyRollup(Base):
+    """Per-user calendar month totals, maintained on check-in"""
+    __tablename__ = "monthly_rollups"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    days_checked_in = Column(Integer, default=0, nullable=False)
+    total_pages = Column(Integer, default=0, nullable=False)
+    total_videos = Column(Integer, default=0, nullable=False)
+    goal_hits = Column(Integer, default=0, nullable=False)
+    best_streak = Column(Integer, default=0, nullable=False)
+    current_run = Column(Integer, default=0, nullable=False)
+    last_check_in_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserVersion(Base):
+    """Per-user version stamp, bumped whenever user-visible data changes"""
+    __tablename__ = "user_versions"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(BigInteger, default=1, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class AvatarRef(Base):
+    """Users and in-progress uploads referencing an avatar's stored files"""
+    __tablename__ = "avatar_refs"
+    
+    stem = Column(String, primary_key=True)  # Same as users.profile_picture, older filenames are longer
+    ref_count = Column(Integer, default=0, nullable=False)
+    deleting_since = Column(DateTime, nullable=True)  # Set while the unreferenced files are deleted
+
+
 class DailyQuote(Base):
     __tablename__ = "daily_quotes"
     
@@ -60,3 +141,15 @@ class DailyQuote(Base):
     quote_text = Column(Text, nullable=False)
     author = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class IdempotencyRecord(Base):
+    """Stored response for an Idempotency-Key (status_code is null while in flight)"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(64), primary_key=True)  # sha256 of caller, route and key
+    fingerprint = Column(String(64), nullable=True)
+    status_code = Column(Integer, nullable=True)
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,119 @@
+import time
+from typing import Optional
+import httpx
+from prometheus_client import Gauge, Histogram
+from config import settings
+
+# Prometheus metrics
+BREAKER_STATE = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state (0 = closed, 1 = open, 2 = half-open)',
+    ['name'],
+    multiprocess_mode='livemax'
+)
+
+OUTBOUND_LATENCY = Histogram(
+    'outbound_request_duration_seconds',
+    'Outbound HTTP call duration in seconds',
+    ['target', 'outcome']
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream.
+
+    After ``failure_threshold`` failures in a row the breaker opens and
+    calls fail immediately. Once ``open_seconds`` have passed, up to
+    ``half_open_calls`` probe calls are let through: a success closes the
+    breaker, a failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: int):
+        self.state = state
+        BREAKER_STATE.labels(name=self.name).set(state)
+
+    def _allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                return False
+            self._probes += 1
+        return True
+
+    def _record_success(self):
+        self._failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def _record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    async def call(self, fn, *args, **kwargs):
+        """Await fn through the breaker, raises CircuitOpenError while open"""
+        if not self._allow():
+            OUTBOUND_LATENCY.labels(target=self.name, outcome="rejected").observe(0)
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        start = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self._record_failure()
+            OUTBOUND_LATENCY.labels(target=self.name, outcome="failure").observe(time.perf_counter() - start)
+            raise
+        self._record_success()
+        OUTBOUND_LATENCY.labels(target=self.name, outcome="success").observe(time.perf_counter() - start)
+        return result
+
+
+# Shared client, opened and closed by the app lifespan
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared connection-pooled client (created on first use outside the app)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=settings.outbound_timeout_seconds,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+quote_breaker = CircuitBreaker(
+    "quote_api",
+    failure_threshold=settings.quote_breaker_failure_threshold,
+    open_seconds=settings.quote_breaker_open_seconds,
+    half_open_calls=settings.quote_breaker_half_open_calls
+)
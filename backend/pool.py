@@ -0,0 +1,142 @@
+import itertools
+import threading
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.responses import JSONResponse
+
+# Prometheus metrics
+POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out',
+    'Connections currently checked out of the pool',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+POOL_OVERFLOW = Gauge(
+    'db_pool_overflow',
+    'Connections open beyond pool_size',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+POOL_WAITERS = Gauge(
+    'db_pool_waiters',
+    'Checkouts waiting for a connection',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+POOL_WAIT_TIME = Histogram(
+    'db_pool_wait_seconds',
+    'Time to check a connection out of the pool',
+    ['pool'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+REQUESTS_SHED = Counter(
+    'requests_shed_total',
+    'Low-priority requests rejected while the connection pool was saturated',
+    ['route']
+)
+
+# A slow checkout keeps counting as current pool wait for this long
+RECENT_WAIT_SECONDS = 1.0
+
+
+class InstrumentedPoolMixin:
+    """Pool metrics, and the current checkout wait for admission control.
+
+    Time is measured around connect(), so it covers waiting for a free
+    connection, opening overflow connections and the pre-ping.
+    """
+
+    name = "pool"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiting = {}
+        self._waiting_lock = threading.Lock()
+        self._tokens = itertools.count()
+        self._last_wait = 0.0
+        self._last_wait_at = 0.0
+
+    def connect(self):
+        token = next(self._tokens)
+        start = time.monotonic()
+        with self._waiting_lock:
+            self._waiting[token] = start
+            POOL_WAITERS.labels(pool=self.name).set(len(self._waiting))
+        try:
+            return super().connect()
+        finally:
+            now = time.monotonic()
+            with self._waiting_lock:
+                del self._waiting[token]
+                POOL_WAITERS.labels(pool=self.name).set(len(self._waiting))
+            self._last_wait = now - start
+            self._last_wait_at = now
+            POOL_WAIT_TIME.labels(pool=self.name).observe(self._last_wait)
+            self._update_gauges()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        POOL_CHECKED_OUT.labels(pool=self.name).set(self.checkedout())
+        POOL_OVERFLOW.labels(pool=self.name).set(max(self.overflow(), 0))
+
+    def current_wait(self) -> float:
+        """Seconds the oldest pending checkout has waited, or the last one if it just finished"""
+        now = time.monotonic()
+        with self._waiting_lock:
+            oldest = min(self._waiting.values(), default=now)
+        recent = self._last_wait if now - self._last_wait_at < RECENT_WAIT_SECONDS else 0.0
+        return max(now - oldest, recent)
+
+
+# Log under SQLAlchemy's own pool loggers, which it keeps at WARNING, rather than "pool.*"
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    name = "sync"
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.QueuePool"
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    name = "async"
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+
+class AdmissionControlMiddleware:
+    """Shed low-priority routes with a fast 503 while the pool is saturated.
+
+    Once checkouts wait longer than SHED_POOL_WAIT_SECONDS, requests under
+    SHED_PATH_PREFIXES (analytics, history, exports) are refused before they
+    queue for a connection, leaving the pool to check-ins and other writes.
+    """
+
+    def __init__(self, app, get_pool, prefixes, max_wait: float, retry_after: int):
+        self.app = app
+        self.get_pool = get_pool
+        self.prefixes = tuple(prefix for prefix in prefixes if prefix)
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_wait <= 0 or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        pool = self.get_pool()
+        if isinstance(pool, InstrumentedPoolMixin) and pool.current_wait() > self.max_wait:
+            prefix = next(prefix for prefix in self.prefixes if scope["path"].startswith(prefix))
+            REQUESTS_SHED.labels(route=prefix).inc()
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
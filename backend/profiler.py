@@ -0,0 +1,182 @@
+import asyncio
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from datetime import datetime
+from pathlib import Path
+from prometheus_client import Counter
+from starlette.datastructures import Headers
+from config import settings
+from metrics import route_template
+
+# Prometheus metrics
+PROFILES_WRITTEN = Counter(
+    'profiles_written_total',
+    'Request profiles written',
+    ['trigger']
+)
+
+PROFILE_SUFFIX = ".folded"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_stack(task) -> list:
+    """Coroutines the task is suspended in, outermost first"""
+    stack = ["(await)"]
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class RequestProfiler:
+    """Samples one request's task from a background thread.
+
+    While the task runs on the event loop the loop thread's Python stack is
+    recorded. While it is suspended the chain of awaited coroutines is
+    recorded under "(await)", so DB and network waits show up too. Work the
+    request hands to the thread pool is not sampled.
+    """
+
+    def __init__(self, path: Path, interval: float):
+        self.path = path
+        self.interval = interval
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.loop_thread = threading.get_ident()
+        self.stacks = StackCounter()
+        self.root = "request"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, the profile is written from the sampler thread"""
+        self._stop.set()
+
+    def _sample(self):
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.reverse()
+        else:
+            stack = _await_stack(self.task)
+        self.stacks[";".join(stack)] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.task.done():
+                break
+            self._sample()
+        write_profile(self.path, StackCounter({
+            f"{self.root};{stack}": count for stack, count in self.stacks.items()
+        }))
+
+
+def write_profile(path: Path, stacks: StackCounter):
+    """Write collapsed stacks (flamegraph.pl, speedscope) and drop the oldest profiles"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w") as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+    os.replace(temp_path, path)
+
+    profiles = list_profiles(path.parent)
+    for old in profiles[settings.profiler_max_files:]:
+        (path.parent / old["name"]).unlink(missing_ok=True)
+
+
+def list_profiles(directory: Path) -> list:
+    """Profiles in directory, newest first"""
+    if not directory.exists():
+        return []
+    entries = [
+        (entry.name, entry.stat()) for entry in os.scandir(directory) if entry.name.endswith(PROFILE_SUFFIX)
+    ]
+    entries.sort(key=lambda entry: entry[1].st_mtime, reverse=True)
+    return [
+        {
+            "name": name,
+            "size": stat.st_size,
+            "created_at": datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+        }
+        for name, stat in entries
+    ]
+
+
+class ProfilerMiddleware:
+    """Profile individual requests on demand.
+
+    A request is profiled when its X-Profile-Token header matches
+    PROFILER_TOKEN, or at random at PROFILER_SAMPLE_RATE. The profile name is
+    returned in the X-Profile header. Only installed when PROFILER_ENABLED
+    is set, so it costs nothing otherwise.
+    """
+
+    def __init__(self, app, directory: str, token: str, sample_rate: float, interval: float):
+        self.app = app
+        self.directory = Path(directory)
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def _trigger(self, scope):
+        if self.token:
+            token = Headers(scope=scope).get("x-profile-token")
+            if token and hmac.compare_digest(token.encode(), self.token):
+                return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        name = "{}-{}-{}{}".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            scope["method"].lower(),
+            scope.get("request_id") or uuid.uuid4().hex[:8],
+            PROFILE_SUFFIX
+        )
+        path = scope["path"]
+        profiler = RequestProfiler(self.directory / name, self.interval)
+
+        async def profile_send(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile", name.encode())]
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, profile_send)
+        finally:
+            # Route goes in the first frame so profiles can be grouped by endpoint
+            profiler.root = f"{scope['method']} {route_template(scope, path)}"
+            profiler.stop()
+            PROFILES_WRITTEN.labels(trigger=trigger).inc()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import date, datetime
-from typing import Optional
+from typing import Dict, Optional, List
 import re
 
 
@@ -47,6 +47,22 @@ class UserGoalsUpdate(BaseModel):
     videos_goal: int = Field(ge=0, le=100)
 
 
+class DirectUploadRequest(BaseModel):
+    content_type: str = Field(pattern=r'^image/[a-z0-9.+-]+$')
+
+
+class DirectUploadResponse(BaseModel):
+    key: str
+    url: str
+    fields: Dict[str, str]
+    max_bytes: int
+    expires_in: int
+
+
+class DirectUploadComplete(BaseModel):
+    key: str = Field(max_length=200)
+
+
 # Check-in schemas
 class CheckInCreate(BaseModel):
     pages_read: int = Field(ge=0, description="Number of pages read")
@@ -66,6 +82,28 @@ class CheckInResponse(BaseModel):
         from_attributes = True
 
 
+class CheckInHistoryItem(BaseModel):
+    """Check-in in a history page, only the requested fields are set"""
+    id: Optional[int] = None
+    check_in_date: Optional[date] = None
+    pages_read: Optional[int] = None
+    videos_watched: Optional[int] = None
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class CheckInImportItem(CheckInCreate):
+    """One row of a bulk import, for any past day"""
+    check_in_date: date
+    
+    @field_validator('check_in_date')
+    @classmethod
+    def not_in_future(cls, v):
+        if v > date.today():
+            raise ValueError('Check-in date cannot be in the future')
+        return v
+
+
 # Streak schemas
 class StreakResponse(BaseModel):
     current_streak: int
@@ -76,6 +114,13 @@ class StreakResponse(BaseModel):
         from_attributes = True
 
 
+class CheckInImportResult(BaseModel):
+    received: int
+    imported: int
+    skipped: int
+    streak: StreakResponse
+
+
 # Quote schemas
 class QuoteResponse(BaseModel):
     quote_text: str
@@ -106,6 +151,15 @@ class MonthlySummary(BaseModel):
     videos_goal: int
 
 
+class CalendarResponse(BaseModel):
+    start_date: date
+    end_date: date
+    days: List[date]
+    days_checked_in: int
+    current_streak: int
+    longest_streak: int
+
+
 # Dashboard schema
 class DashboardResponse(BaseModel):
     has_checked_in_today: bool
@@ -1,17 +1,50 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from models import User, CheckIn, Streak, DailyQuote
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, update, cast, and_, case, tuple_, Integer
+from sqlalchemy.dialects.postgresql import insert
+from models import (
+    User, CheckIn, Streak, DailyQuote, DashboardSnapshot, UserVersion, WeeklyRollup, MonthlyRollup,
+    ActivityBitmap, AvatarRef
+)
 from datetime import date, datetime, timedelta
 from typing import Optional, List
-import httpx
+from pathlib import Path
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+import zlib
+from starlette.concurrency import run_in_threadpool
 from config import settings
-from auth import get_password_hash
+from database import run_db, open_session
+from auth import invalidate_principal
+from cache import CACHE_REQUESTS
+from outbound import get_http_client, quote_breaker, CircuitOpenError
+
+QUOTE_CACHE_HITS = CACHE_REQUESTS.labels(cache="daily_quote", result="hit")
+QUOTE_CACHE_MISSES = CACHE_REQUESTS.labels(cache="daily_quote", result="miss")
+
+# Columns a check-in history page can be projected to
+CHECK_IN_FIELDS = ["id", "check_in_date", "pages_read", "videos_watched", "notes", "created_at"]
+
+# Rows per multi-row INSERT when importing check-ins
+IMPORT_BATCH_SIZE = 1000
+
+# A delete marker left behind by a crashed worker stops blocking uploads after this
+AVATAR_DELETE_SECONDS = 60
+
+# Offline quotes used when the quote API is unreachable
+QUOTE_CORPUS = json.loads((Path(__file__).parent / "quotes.json").read_text())
+
+logger = logging.getLogger(__name__)
 
 
 class UserService:
     @staticmethod
-    def create_user(email: str, username: str, password: str, db: Session) -> User:
-        """Create new user with hashed password"""
+    def check_available(email: str, username: str, db: Session):
+        """Raise ValueError if the email or username is already taken"""
         # Check if email exists
         if db.query(User).filter(User.email == email).first():
             raise ValueError("Email already registered")
@@ -19,38 +52,166 @@ class UserService:
         # Check if username exists
         if db.query(User).filter(User.username == username).first():
             raise ValueError("Username already taken")
+    
+    @staticmethod
+    def create_user(email: str, username: str, hashed_password: str, db: Session) -> User:
+        """Create new user with an already hashed password"""
+        # Checked again, the name may have been taken while the password was hashed
+        UserService.check_available(email, username, db)
         
         # Create user
         user = User(
             email=email,
             username=username,
-            hashed_password=get_password_hash(password)
+            hashed_password=hashed_password
         )
         db.add(user)
         db.commit()
         db.refresh(user)
         
-        # Create initial streak record
-        streak = Streak(user_id=user.id)
-        db.add(streak)
+        # Create initial streak and dashboard records
+        db.add(Streak(user_id=user.id))
+        db.add(DashboardSnapshot(user_id=user.id))
         db.commit()
         
         return user
     
     @staticmethod
-    def update_profile_picture(user: User, filename: str, db: Session):
-        """Update user's profile picture"""
-        user.profile_picture = filename
+    def update_profile_picture(user: User, filename: str, db: Session) -> Optional[str]:
+        """Point the user at an avatar, taking over the reference acquired for its upload.
+        
+        Returns the previous picture when nothing references it any more.
+        """
+        # The authenticated user may be a cached copy, read the current picture under lock
+        old_picture = db.execute(
+            select(User.profile_picture).where(User.id == user.id).with_for_update()
+        ).scalar()
+        # Lock the old count while this user still counts towards it
+        old_ref = AvatarService.lock_ref(old_picture, db) if old_picture else None
+        
+        db.execute(update(User).where(User.id == user.id).values(profile_picture=filename))
+        VersionService.bump(user.id, db)
+        unreferenced = None
+        if old_ref is not None:
+            old_ref.ref_count = max(old_ref.ref_count - 1, 0)
+            if old_ref.ref_count == 0:
+                unreferenced = old_picture
         db.commit()
-        db.refresh(user)
+        invalidate_principal(user.id)
+        return unreferenced
     
     @staticmethod
-    def update_goals(user: User, pages_goal: int, videos_goal: int, db: Session):
+    def update_goals(user: User, pages_goal: int, videos_goal: int, db: Session) -> User:
         """Update user's daily goals"""
+        # The authenticated user may be a stale cached copy, change the current row instead
+        user = db.get(User, user.id, with_for_update=True)
         user.pages_goal = pages_goal
         user.videos_goal = videos_goal
+        # Goal hits are always judged against the current goals, re-judge the history
+        RollupService.rebuild_user(user, db)
+        VersionService.bump(user.id, db)
         db.commit()
         db.refresh(user)
+        invalidate_principal(user.id)
+        return user
+
+
+class AvatarService:
+    """Reference counts of stored avatars.
+    
+    Identical uploads share files, so they are deleted only once no user and
+    no upload in progress references them. Every change locks the stem's
+    avatar_refs row for one short transaction. Deleting the files is marked
+    with deleting_since instead, so no row lock is held while they go.
+    """
+    
+    @staticmethod
+    def lock_ref(stem: str, db: Session) -> AvatarRef:
+        """Lock a stem's count, counting its users for avatars stored before reference counts"""
+        while True:
+            db.execute(
+                insert(AvatarRef)
+                .values(
+                    stem=stem,
+                    ref_count=select(func.count(User.id)).where(User.profile_picture == stem).scalar_subquery()
+                )
+                .on_conflict_do_nothing(index_elements=[AvatarRef.stem])
+            )
+            ref = db.execute(
+                select(AvatarRef).where(AvatarRef.stem == stem).with_for_update()
+            ).scalar_one_or_none()
+            if ref is not None:
+                return ref
+            # A concurrent delete removed the row, insert it again
+    
+    @staticmethod
+    def acquire(stem: str, db: Session) -> bool:
+        """Reference an upload's stem before its files are checked or written.
+        
+        Returns False while the stem's files are being deleted, the caller
+        retries once they are gone.
+        """
+        ref = AvatarService.lock_ref(stem, db)
+        if ref.deleting_since is not None:
+            if ref.deleting_since > datetime.utcnow() - timedelta(seconds=AVATAR_DELETE_SECONDS):
+                db.rollback()
+                return False
+            # The deleting worker died, any files it removed are written again
+            ref.deleting_since = None
+        ref.ref_count += 1
+        db.commit()
+        return True
+    
+    @staticmethod
+    def abandon(stem: str, db: Session) -> bool:
+        """Drop the reference of a failed upload, True when nothing references the stem"""
+        ref = AvatarService.lock_ref(stem, db)
+        ref.ref_count = max(ref.ref_count - 1, 0)
+        db.commit()
+        return ref.ref_count == 0
+    
+    @staticmethod
+    def mark_deleting(stem: str, db: Session) -> bool:
+        """Mark an unreferenced stem as being deleted, False if it is referenced or already marked"""
+        ref = db.execute(select(AvatarRef).where(AvatarRef.stem == stem).with_for_update()).scalar_one_or_none()
+        if ref is None or ref.ref_count > 0 or ref.deleting_since is not None:
+            db.rollback()
+            return False
+        ref.deleting_since = datetime.utcnow()
+        db.commit()
+        return True
+    
+    @staticmethod
+    def forget(stem: str, db: Session):
+        """Remove a stem whose files were deleted, unless an upload took the marker over"""
+        db.query(AvatarRef).filter(AvatarRef.stem == stem, AvatarRef.deleting_since.isnot(None)).delete()
+        db.commit()
+    
+    @staticmethod
+    def unmark_deleting(stem: str, db: Session):
+        """Clear the marker after the files could not be deleted, they go when the stem is next unreferenced"""
+        db.query(AvatarRef).filter(AvatarRef.stem == stem).update({AvatarRef.deleting_since: None})
+        db.commit()
+
+
+class VersionService:
+    @staticmethod
+    def get_version(user_id: int, db: Session) -> int:
+        """Get user's version stamp (0 until the first change)"""
+        version = db.query(UserVersion.version).filter(UserVersion.user_id == user_id).scalar()
+        return version or 0
+    
+    @staticmethod
+    def bump(user_id: int, db: Session):
+        """Increment user's version stamp (caller commits)"""
+        db.execute(
+            insert(UserVersion)
+            .values(user_id=user_id, version=1, updated_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=[UserVersion.user_id],
+                set_={"version": UserVersion.version + 1, "updated_at": datetime.utcnow()}
+            )
+        )
 
 
 class CheckInService:
@@ -71,125 +232,743 @@ class CheckInService:
         notes: Optional[str],
         db: Session
     ) -> CheckIn:
-        """Create a new check-in (immutable, once per day)"""
+        """Create a new check-in (immutable, once per day) in one transaction.
+        
+        The unique (user_id, check_in_date) index decides duplicates: the
+        INSERT ... ON CONFLICT DO NOTHING RETURNING comes back empty when the
+        day is already taken, so concurrent submits cannot both get through.
+        """
         today = date.today()
         
-        # Check if already checked in today
-        existing = CheckInService.get_today_check_in(user.id, db)
-        if existing:
+        check_in = db.scalars(
+            insert(CheckIn)
+            .values(
+                user_id=user.id,
+                check_in_date=today,
+                pages_read=pages_read,
+                videos_watched=videos_watched,
+                notes=notes
+            )
+            .on_conflict_do_nothing(index_elements=[CheckIn.user_id, CheckIn.check_in_date])
+            .returning(CheckIn)
+        ).first()
+        if check_in is None:
+            db.rollback()
             raise ValueError("Already checked in today")
         
-        # Create check-in
-        check_in = CheckIn(
-            user_id=user.id,
-            check_in_date=today,
-            pages_read=pages_read,
-            videos_watched=videos_watched,
-            notes=notes
-        )
-        db.add(check_in)
-        
-        # Update streak
-        StreakService.update_streak(user.id, today, db)
+        # Update streak and derived read models in the same transaction
+        streak = StreakService.update_streak(user.id, today, db)
+        DashboardService.record_check_in(check_in, streak, db)
+        RollupService.record_check_in(check_in, user, db)
+        ActivityService.record_day(user.id, today, db)
+        VersionService.bump(user.id, db)
         
+        # Keep the returned row loaded instead of expiring it on commit
+        db.expunge(check_in)
         db.commit()
-        db.refresh(check_in)
         return check_in
     
     @staticmethod
-    def get_user_check_ins(user_id: int, limit: int, db: Session) -> List[CheckIn]:
-        """Get user's recent check-ins"""
-        return db.query(CheckIn).filter(
+    def import_check_ins(user: User, rows: List[dict], db: Session) -> dict:
+        """Backfill check-ins in one transaction, skipping days already checked in.
+        
+        Rows go in as multi-row INSERT ... ON CONFLICT DO NOTHING batches, then
+        the streak, snapshot, rollups and calendar are rebuilt once from the
+        full history rather than per row.
+        """
+        imported = 0
+        for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+            batch = [{**row, "user_id": user.id} for row in rows[i:i + IMPORT_BATCH_SIZE]]
+            result = db.execute(
+                insert(CheckIn)
+                .values(batch)
+                .on_conflict_do_nothing(index_elements=[CheckIn.user_id, CheckIn.check_in_date])
+                .returning(CheckIn.id)
+            )
+            imported += len(result.all())
+        
+        if imported:
+            # Rollups judge against the current goals, not a cached principal's
+            user = db.get(User, user.id, with_for_update=True)
+            streak = StreakService.recompute_streak(user.id, db)
+            db.flush()
+            db.merge(DashboardService.build_snapshot(user.id, db))
+            RollupService.rebuild_user(user, db)
+            ActivityService.rebuild_user(user.id, db)
+            VersionService.bump(user.id, db)
+            db.commit()
+        else:
+            streak = StreakService.get_streak(user.id, db)
+        
+        return {
+            "received": len(rows),
+            "imported": imported,
+            "skipped": len(rows) - imported,
+            "streak": {
+                "current_streak": StreakService.effective_streak(streak.current_streak, streak.last_check_in_date),
+                "longest_streak": streak.longest_streak,
+                "last_check_in_date": streak.last_check_in_date
+            }
+        }
+    
+    @staticmethod
+    def encode_cursor(check_in_date: date, check_in_id: int) -> str:
+        """Opaque cursor for the position after a check-in"""
+        raw = f"{check_in_date.isoformat()}:{check_in_id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        """Decode a cursor into (check_in_date, id)"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            check_in_date, check_in_id = raw.split(":")
+            return date.fromisoformat(check_in_date), int(check_in_id)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    
+    @staticmethod
+    def get_user_check_ins(
+        user_id: int,
+        limit: int,
+        db: Session,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> tuple:
+        """Get one page of user's check-ins, newest first.
+        
+        Keyset pagination on (check_in_date, id): each page is an index range
+        scan no matter how deep it is. Returns (rows as dicts, next cursor).
+        """
+        fields = fields or CHECK_IN_FIELDS
+        unknown = set(fields) - set(CHECK_IN_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        # The cursor needs the sort key even when it is not requested
+        columns = list(dict.fromkeys(["id", "check_in_date", *fields]))
+        
+        query = db.query(*[getattr(CheckIn, name) for name in columns]).filter(
             CheckIn.user_id == user_id
-        ).order_by(CheckIn.check_in_date.desc()).limit(limit).all()
+        )
+        if cursor:
+            after_date, after_id = CheckInService.decode_cursor(cursor)
+            query = query.filter(tuple_(CheckIn.check_in_date, CheckIn.id) < tuple_(after_date, after_id))
+        
+        rows = query.order_by(
+            CheckIn.check_in_date.desc(), CheckIn.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = CheckInService.encode_cursor(rows[-1].check_in_date, rows[-1].id)
+        
+        return [{name: getattr(row, name) for name in fields} for row in rows], next_cursor
+
+
+class ExportService:
+    FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+    BATCH_SIZE = 1000
+    
+    @staticmethod
+    def _encode(rows, columns: List[str], fmt: str) -> bytes:
+        """Encode a batch of rows as NDJSON lines or CSV records"""
+        if fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            return buffer.getvalue().encode()
+        return "".join(
+            json.dumps(dict(zip(columns, row)), default=lambda value: value.isoformat()) + "\n" for row in rows
+        ).encode()
+    
+    @staticmethod
+    async def stream_check_ins(user_id: Optional[int], fmt: str):
+        """Yield check-ins as encoded chunks, all users when user_id is None.
+        
+        Rows are read through a server-side cursor in batches on a session of
+        its own, so memory stays flat however long the history is.
+        """
+        columns = ["check_in_date", "pages_read", "videos_watched", "notes", "created_at"]
+        stmt = select(*[getattr(CheckIn, name) for name in columns])
+        if user_id is None:
+            columns.insert(0, "user_id")
+            stmt = select(*[getattr(CheckIn, name) for name in columns]).order_by(
+                CheckIn.user_id, CheckIn.check_in_date
+            )
+        else:
+            stmt = stmt.where(CheckIn.user_id == user_id).order_by(CheckIn.check_in_date)
+        stmt = stmt.execution_options(yield_per=ExportService.BATCH_SIZE)
+        
+        if fmt == "csv":
+            yield ExportService._encode([columns], columns, fmt)
+        
+        async with open_session() as db:
+            if isinstance(db, AsyncSession):
+                result = await db.stream(stmt)
+                async for rows in result.partitions():
+                    yield ExportService._encode(rows, columns, fmt)
+            else:
+                # Blocking fetches run in the threadpool, one batch at a time
+                result = await run_in_threadpool(db.execute, stmt)
+                partitions = result.partitions()
+                while (rows := await run_in_threadpool(next, partitions, None)) is not None:
+                    yield ExportService._encode(rows, columns, fmt)
+    
+    @staticmethod
+    async def gzip(chunks):
+        """Gzip an async byte stream chunk by chunk"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
 
 
 class StreakService:
     @staticmethod
     def get_streak(user_id: int, db: Session) -> Streak:
-        """Get user's streak"""
+        """Get user's streak (an unsaved empty streak if the user has none)"""
         streak = db.query(Streak).filter(Streak.user_id == user_id).first()
         if not streak:
-            streak = Streak(user_id=user_id)
-            db.add(streak)
-            db.commit()
-            db.refresh(streak)
+            streak = Streak(user_id=user_id, current_streak=0, longest_streak=0)
         return streak
     
     @staticmethod
-    def update_streak(user_id: int, check_in_date: date, db: Session):
-        """Update streak based on new check-in"""
+    def effective_streak(current_streak: int, last_check_in_date: Optional[date]) -> int:
+        """Current streak as of today, 0 once more than a day has been missed"""
+        if last_check_in_date and (date.today() - last_check_in_date).days > 1:
+            # Streak broken
+            return 0
+        return current_streak
+    
+    @staticmethod
+    def get_current_streak(user_id: int, db: Session) -> dict:
+        """Get user's streak as of today (read-only)"""
         streak = StreakService.get_streak(user_id, db)
+        return {
+            "current_streak": StreakService.effective_streak(streak.current_streak, streak.last_check_in_date),
+            "longest_streak": streak.longest_streak,
+            "last_check_in_date": streak.last_check_in_date
+        }
+    
+    @staticmethod
+    def reset_stale_streaks(db: Session) -> int:
+        """Persist broken streaks as 0 in one set-based UPDATE, returns rows changed.
         
-        if streak.last_check_in_date is None:
-            # First check-in
-            streak.current_streak = 1
-            streak.longest_streak = 1
-        else:
-            days_diff = (check_in_date - streak.last_check_in_date).days
-            
-            if days_diff == 1:
-                # Consecutive day
-                streak.current_streak += 1
-                if streak.current_streak > streak.longest_streak:
-                    streak.longest_streak = streak.current_streak
-            elif days_diff == 0:
-                # Same day (shouldn't happen due to check)
-                pass
-            else:
-                # Missed days - reset streak
-                streak.current_streak = 1
+        Reads already report the effective streak, so this only keeps the
+        stored values tidy and is safe to run at any time.
+        """
+        cutoff = date.today() - timedelta(days=1)
+        result = db.execute(
+            update(Streak)
+            .where(Streak.current_streak > 0, Streak.last_check_in_date < cutoff)
+            .values(current_streak=0, updated_at=datetime.utcnow())
+        )
+        db.execute(
+            update(DashboardSnapshot)
+            .where(DashboardSnapshot.current_streak > 0, DashboardSnapshot.last_check_in_date < cutoff)
+            .values(current_streak=0, updated_at=datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+    
+    @staticmethod
+    def recompute_streak(user_id: int, db: Session) -> Streak:
+        """Set the streak from the user's full check-in history (caller commits).
+        
+        Same gaps-and-islands grouping as AnalyticsService.summarize: the
+        current streak is the latest run and the longest is the biggest one.
+        """
+        row_number = func.row_number().over(order_by=CheckIn.check_in_date)
+        islands = db.query(
+            CheckIn.check_in_date.label("day"),
+            (CheckIn.check_in_date - cast(row_number, Integer)).label("island")
+        ).filter(CheckIn.user_id == user_id).subquery()
+        runs = db.query(
+            func.count().label("length"),
+            func.max(islands.c.day).label("last_day")
+        ).group_by(islands.c.island).subquery()
+        latest = db.query(
+            runs.c.length,
+            runs.c.last_day,
+            func.max(runs.c.length).over().label("longest")
+        ).order_by(runs.c.last_day.desc()).first()
         
-        streak.last_check_in_date = check_in_date
+        streak = StreakService.get_streak(user_id, db)
+        if streak.id is None:
+            db.add(streak)
+        streak.current_streak = latest.length if latest else 0
+        streak.longest_streak = latest.longest if latest else 0
+        streak.last_check_in_date = latest.last_day if latest else None
         streak.updated_at = datetime.utcnow()
-        db.commit()
+        return streak
+    
+    @staticmethod
+    def update_streak(user_id: int, check_in_date: date, db: Session):
+        """Advance the streak for a new check-in in one UPDATE ... RETURNING (caller commits).
+        
+        Returns a row with current_streak and longest_streak.
+        """
+        new_streak = case(
+            (Streak.last_check_in_date == check_in_date - timedelta(days=1), Streak.current_streak + 1),
+            (Streak.last_check_in_date == check_in_date, Streak.current_streak),
+            else_=1
+        )
+        streak = db.execute(
+            update(Streak)
+            .where(Streak.user_id == user_id)
+            .values(
+                current_streak=new_streak,
+                longest_streak=func.greatest(Streak.longest_streak, new_streak),
+                last_check_in_date=check_in_date,
+                updated_at=datetime.utcnow()
+            )
+            .returning(Streak.current_streak, Streak.longest_streak)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if streak is None:
+            # Users created before streak rows were added at registration
+            streak = Streak(
+                user_id=user_id,
+                current_streak=1,
+                longest_streak=1,
+                last_check_in_date=check_in_date,
+                updated_at=datetime.utcnow()
+            )
+            db.add(streak)
+        return streak
+
+
+class ActivityService:
+    BITMAP_BYTES = 46  # 366 days
+    MAX_RANGE_DAYS = 3660  # ten years
+    
+    @staticmethod
+    def _day_bit(day: date) -> int:
+        return day.timetuple().tm_yday - 1
+    
+    @staticmethod
+    def record_day(user_id: int, day: date, db: Session):
+        """Set the day's bit in the user's bitmap for that year (caller commits)"""
+        bit = ActivityService._day_bit(day)
+        days = bytearray(ActivityService.BITMAP_BYTES)
+        days[bit // 8] |= 1 << (bit % 8)
+        db.execute(
+            insert(ActivityBitmap)
+            .values(user_id=user_id, year=day.year, days=bytes(days), updated_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=[ActivityBitmap.user_id, ActivityBitmap.year],
+                set_={"days": func.set_bit(ActivityBitmap.days, bit, 1), "updated_at": datetime.utcnow()}
+            )
+        )
+    
+    @staticmethod
+    def rebuild_user(user_id: int, db: Session):
+        """Recompute a user's bitmaps from check-ins (caller commits)"""
+        years = {}
+        rows = db.query(CheckIn.check_in_date).filter(CheckIn.user_id == user_id).yield_per(1000)
+        for (check_in_date,) in rows:
+            days = years.setdefault(check_in_date.year, bytearray(ActivityService.BITMAP_BYTES))
+            bit = ActivityService._day_bit(check_in_date)
+            days[bit // 8] |= 1 << (bit % 8)
+        
+        db.query(ActivityBitmap).filter(ActivityBitmap.user_id == user_id).delete()
+        if years:
+            db.execute(insert(ActivityBitmap), [
+                {"user_id": user_id, "year": year, "days": bytes(days), "updated_at": datetime.utcnow()}
+                for year, days in years.items()
+            ])
+    
+    @staticmethod
+    def get_range_bits(user_id: int, start: date, end: date, db: Session) -> int:
+        """Bits for [start, end] as one integer, bit i set when start + i days has a check-in"""
+        bitmaps = db.query(ActivityBitmap.year, ActivityBitmap.days).filter(
+            ActivityBitmap.user_id == user_id,
+            ActivityBitmap.year >= start.year,
+            ActivityBitmap.year <= end.year
+        ).all()
+        
+        bits = 0
+        for year, days in bitmaps:
+            year_bits = int.from_bytes(days, "little")
+            offset = (date(year, 1, 1) - start).days
+            bits |= year_bits << offset if offset >= 0 else year_bits >> -offset
+        return bits & ((1 << ((end - start).days + 1)) - 1)
+    
+    @staticmethod
+    def get_calendar(user_id: int, start: date, end: date, db: Session) -> dict:
+        """Check-in days and streak stats for [start, end] from the bitmaps"""
+        if end < start:
+            raise ValueError("'to' must not be before 'from'")
+        if (end - start).days >= ActivityService.MAX_RANGE_DAYS:
+            raise ValueError(f"Range is limited to {ActivityService.MAX_RANGE_DAYS} days")
+        
+        bits = ActivityService.get_range_bits(user_id, start, end, db)
+        
+        # Longest run of set bits: each AND with its shifted self trims every run by one
+        longest_streak, run_bits = 0, bits
+        while run_bits:
+            run_bits &= run_bits >> 1
+            longest_streak += 1
+        
+        # Current streak: run ending at the last day, which may be yesterday
+        # while today has no check-in yet
+        last = min((end - start).days, (date.today() - start).days)
+        current_streak = 0
+        if last >= 0:
+            if last > 0 and not bits >> last & 1 and end >= date.today():
+                last -= 1
+            window = bits & ((1 << (last + 1)) - 1)
+            current_streak = last + 1 - (~window & ((1 << (last + 1)) - 1)).bit_length()
+        
+        days = []
+        remaining = bits
+        while remaining:
+            lowest = remaining & -remaining
+            days.append(start + timedelta(days=lowest.bit_length() - 1))
+            remaining ^= lowest
+        
+        return {
+            "start_date": start,
+            "end_date": end,
+            "days": days,
+            "days_checked_in": len(days),
+            "current_streak": current_streak,
+            "longest_streak": longest_streak
+        }
+
+
+class DashboardService:
+    @staticmethod
+    def record_check_in(check_in: CheckIn, streak: Streak, db: Session):
+        """Upsert the user's snapshot after a check-in (caller commits)"""
+        values = dict(
+            current_streak=streak.current_streak,
+            longest_streak=streak.longest_streak,
+            last_check_in_date=check_in.check_in_date,
+            last_check_in_id=check_in.id,
+            last_pages_read=check_in.pages_read,
+            last_videos_watched=check_in.videos_watched,
+            last_notes=check_in.notes,
+            last_check_in_created_at=check_in.created_at,
+            updated_at=datetime.utcnow()
+        )
+        db.execute(
+            insert(DashboardSnapshot)
+            .values(user_id=check_in.user_id, **values)
+            .on_conflict_do_update(index_elements=[DashboardSnapshot.user_id], set_=values)
+        )
+    
+    @staticmethod
+    def build_snapshot(user_id: int, db: Session) -> DashboardSnapshot:
+        """Build a snapshot from streaks and check-ins (not added to the session)"""
+        streak = db.query(Streak).filter(Streak.user_id == user_id).first()
+        last = db.query(CheckIn).filter(
+            CheckIn.user_id == user_id
+        ).order_by(CheckIn.check_in_date.desc()).first()
+        
+        snapshot = DashboardSnapshot(
+            user_id=user_id,
+            current_streak=streak.current_streak if streak else 0,
+            longest_streak=streak.longest_streak if streak else 0,
+            updated_at=datetime.utcnow()
+        )
+        if last:
+            snapshot.last_check_in_date = last.check_in_date
+            snapshot.last_check_in_id = last.id
+            snapshot.last_pages_read = last.pages_read
+            snapshot.last_videos_watched = last.videos_watched
+            snapshot.last_notes = last.notes
+            snapshot.last_check_in_created_at = last.created_at
+        return snapshot
+    
+    @staticmethod
+    def get_dashboard(user_id: int, db: Session) -> dict:
+        """Get streak and today's check-in from the user's snapshot (one primary-key read)"""
+        snapshot = db.get(DashboardSnapshot, user_id)
+        if snapshot is None:
+            # Users from before snapshots existed, until the backfill job has run
+            snapshot = DashboardService.build_snapshot(user_id, db)
+        
+        today = date.today()
+        today_check_in = None
+        if snapshot.last_check_in_date == today:
+            today_check_in = {
+                "id": snapshot.last_check_in_id,
+                "check_in_date": snapshot.last_check_in_date,
+                "pages_read": snapshot.last_pages_read,
+                "videos_watched": snapshot.last_videos_watched,
+                "notes": snapshot.last_notes,
+                "created_at": snapshot.last_check_in_created_at
+            }
+        
+        return {
+            "has_checked_in_today": today_check_in is not None,
+            "today_check_in": today_check_in,
+            "streak": {
+                "current_streak": StreakService.effective_streak(
+                    snapshot.current_streak, snapshot.last_check_in_date
+                ),
+                "longest_streak": snapshot.longest_streak,
+                "last_check_in_date": snapshot.last_check_in_date
+            }
+        }
 
 
 class QuoteService:
+    # Process-local copy of today's quote, replaced when the date rolls over
+    _cached_date: Optional[date] = None
+    _cached_quote: Optional[DailyQuote] = None
+    # Single-flight guard so one coroutine per process loads or fetches
+    _lock = asyncio.Lock()
+    
+    @staticmethod
+    def get_stored_quote(quote_date: date, db: Session) -> Optional[DailyQuote]:
+        """Get stored quote for a date, detached so it can be cached"""
+        quote = db.query(DailyQuote).filter(DailyQuote.date == quote_date).first()
+        if quote is not None:
+            db.expunge(quote)
+        return quote
+    
+    @staticmethod
+    def store_quote(quote_date: date, quote_text: str, author: Optional[str], db: Session) -> DailyQuote:
+        """Store quote for a date, or return the row another worker stored first"""
+        db.execute(
+            insert(DailyQuote)
+            .values(date=quote_date, quote_text=quote_text, author=author)
+            .on_conflict_do_nothing(index_elements=[DailyQuote.date])
+        )
+        db.commit()
+        return QuoteService.get_stored_quote(quote_date, db)
+    
+    @staticmethod
+    def fallback_quote(quote_date: date) -> tuple:
+        """Pick a quote from the bundled corpus, the same one for a given date"""
+        quote_data = QUOTE_CORPUS[quote_date.toordinal() % len(QUOTE_CORPUS)]
+        return quote_data["quote_text"], quote_data["author"]
+    
+    @staticmethod
+    async def fetch_quote(quote_date: date) -> tuple:
+        """Fetch a quote from the external API, returns (quote_text, author)"""
+        async def request():
+            response = await get_http_client().get(settings.quote_api_url)
+            response.raise_for_status()
+            return response.json()
+        
+        try:
+            data = await quote_breaker.call(request)
+            
+            # quotable.io returns array
+            if isinstance(data, list) and len(data) > 0:
+                quote_data = data[0]
+            else:
+                quote_data = data
+            
+            quote_text = quote_data.get("content") or quote_data.get("quote")
+            author = quote_data.get("author")
+            if quote_text:
+                return quote_text, author
+        except CircuitOpenError:
+            # Upstream known bad, fail over without waiting on it
+            pass
+        except Exception as e:
+            logger.warning(f"Quote API unavailable, using bundled corpus: {e}")
+        
+        return QuoteService.fallback_quote(quote_date)
+    
     @staticmethod
-    async def get_daily_quote(db: Session) -> DailyQuote:
-        """Get or fetch today's quote"""
+    async def prefetch_quote(quote_date: date, db) -> DailyQuote:
+        """Make sure a quote is stored for a date, fetching it from the API if needed"""
+        quote = await run_db(db, QuoteService.get_stored_quote, quote_date)
+        if quote is None:
+            quote_text, author = await QuoteService.fetch_quote(quote_date)
+            quote = await run_db(db, QuoteService.store_quote, quote_date, quote_text, author)
+        return quote
+    
+    @staticmethod
+    async def get_daily_quote(db) -> DailyQuote:
+        """Get today's quote (works with Session or AsyncSession).
+        
+        Never calls the external API, quotes are fetched ahead of time by the
+        prefetcher and a miss falls back to the bundled corpus.
+        """
         today = date.today()
         
-        # Check if we have today's quote
-        quote = db.query(DailyQuote).filter(DailyQuote.date == today).first()
-        if quote:
+        if QuoteService._cached_date == today:
+            QUOTE_CACHE_HITS.inc()
+            return QuoteService._cached_quote
+        
+        async with QuoteService._lock:
+            # Another coroutine may have filled the cache while we waited
+            if QuoteService._cached_date == today:
+                QUOTE_CACHE_HITS.inc()
+                return QuoteService._cached_quote
+            QUOTE_CACHE_MISSES.inc()
+            
+            # Check if we have today's quote
+            quote = await run_db(db, QuoteService.get_stored_quote, today)
+            if quote is None:
+                quote_text, author = QuoteService.fallback_quote(today)
+                quote = await run_db(db, QuoteService.store_quote, today, quote_text, author)
+            
+            QuoteService._cached_date = today
+            QuoteService._cached_quote = quote
             return quote
+    
+    @staticmethod
+    async def run_prefetcher():
+        """Background task: keep today's and tomorrow's quotes stored"""
+        while True:
+            try:
+                today = date.today()
+                async with open_session() as db:
+                    await QuoteService.prefetch_quote(today, db)
+                    await QuoteService.prefetch_quote(today + timedelta(days=1), db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Quote prefetch failed: {e}")
+            await asyncio.sleep(settings.quote_prefetch_interval_seconds)
+
+
+class RollupService:
+    @staticmethod
+    def _upsert(model, keys: dict, check_in: CheckIn, goal_hit: bool, db: Session):
+        """Fold one check-in into a rollup row (check-ins arrive in date order)"""
+        previous_day = check_in.check_in_date - timedelta(days=1)
+        run = case(
+            (model.last_check_in_date == previous_day, model.current_run + 1),
+            else_=1
+        )
+        now = datetime.utcnow()
+        db.execute(
+            insert(model)
+            .values(
+                **keys,
+                days_checked_in=1,
+                total_pages=check_in.pages_read,
+                total_videos=check_in.videos_watched,
+                goal_hits=int(goal_hit),
+                best_streak=1,
+                current_run=1,
+                last_check_in_date=check_in.check_in_date,
+                updated_at=now
+            )
+            .on_conflict_do_update(
+                index_elements=list(keys),
+                set_={
+                    "days_checked_in": model.days_checked_in + 1,
+                    "total_pages": model.total_pages + check_in.pages_read,
+                    "total_videos": model.total_videos + check_in.videos_watched,
+                    "goal_hits": model.goal_hits + int(goal_hit),
+                    "best_streak": func.greatest(model.best_streak, run),
+                    "current_run": run,
+                    "last_check_in_date": check_in.check_in_date,
+                    "updated_at": now
+                }
+            )
+        )
+    
+    @staticmethod
+    def record_check_in(check_in: CheckIn, user: User, db: Session):
+        """Update the week and month rollups for a new check-in (caller commits).
         
-        # Fetch new quote from API
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(settings.quote_api_url)
-                response.raise_for_status()
-                data = response.json()
-                
-                # quotable.io returns array
-                if isinstance(data, list) and len(data) > 0:
-                    quote_data = data[0]
-                else:
-                    quote_data = data
-                
-                quote_text = quote_data.get("content") or quote_data.get("quote")
-                author = quote_data.get("author")
-        except Exception:
-            # Fallback quote
-            quote_text = "The impediment to action advances action. What stands in the way becomes the way."
-            author = "Marcus Aurelius"
-        
-        # Store in database
-        quote = DailyQuote(
-            date=today,
-            quote_text=quote_text,
-            author=author
+        Goal hits use the user's current goals, like summarize() and
+        rebuild_user(); update_goals rebuilds the rollups when they change.
+        """
+        goal_hit = check_in.pages_read >= user.pages_goal and check_in.videos_watched >= user.videos_goal
+        iso_year, iso_week, _ = check_in.check_in_date.isocalendar()
+        RollupService._upsert(
+            WeeklyRollup,
+            {"user_id": user.id, "iso_year": iso_year, "iso_week": iso_week},
+            check_in, goal_hit, db
         )
-        db.add(quote)
-        db.commit()
-        db.refresh(quote)
+        RollupService._upsert(
+            MonthlyRollup,
+            {"user_id": user.id, "year": check_in.check_in_date.year, "month": check_in.check_in_date.month},
+            check_in, goal_hit, db
+        )
+    
+    @staticmethod
+    def rebuild_user(user: User, db: Session):
+        """Recompute all of a user's rollups from check-ins (caller commits).
         
-        return quote
+        Historical goals are not stored, so goal hits are judged against the
+        user's current goals.
+        """
+        db.query(WeeklyRollup).filter(WeeklyRollup.user_id == user.id).delete()
+        db.query(MonthlyRollup).filter(MonthlyRollup.user_id == user.id).delete()
+        
+        weeks, months = {}, {}
+        rows = db.query(
+            CheckIn.check_in_date, CheckIn.pages_read, CheckIn.videos_watched
+        ).filter(CheckIn.user_id == user.id).order_by(CheckIn.check_in_date).yield_per(1000)
+        
+        for check_in_date, pages_read, videos_watched in rows:
+            goal_hit = pages_read >= user.pages_goal and videos_watched >= user.videos_goal
+            iso_year, iso_week, _ = check_in_date.isocalendar()
+            buckets = (
+                weeks.setdefault((iso_year, iso_week), {
+                    "user_id": user.id, "iso_year": iso_year, "iso_week": iso_week
+                }),
+                months.setdefault((check_in_date.year, check_in_date.month), {
+                    "user_id": user.id, "year": check_in_date.year, "month": check_in_date.month
+                })
+            )
+            for bucket in buckets:
+                consecutive = bucket.get("last_check_in_date") == check_in_date - timedelta(days=1)
+                bucket["current_run"] = bucket.get("current_run", 0) + 1 if consecutive else 1
+                bucket["best_streak"] = max(bucket.get("best_streak", 0), bucket["current_run"])
+                bucket["days_checked_in"] = bucket.get("days_checked_in", 0) + 1
+                bucket["total_pages"] = bucket.get("total_pages", 0) + pages_read
+                bucket["total_videos"] = bucket.get("total_videos", 0) + videos_watched
+                bucket["goal_hits"] = bucket.get("goal_hits", 0) + int(goal_hit)
+                bucket["last_check_in_date"] = check_in_date
+                bucket["updated_at"] = datetime.utcnow()
+        
+        if weeks:
+            db.execute(insert(WeeklyRollup), list(weeks.values()))
+            db.execute(insert(MonthlyRollup), list(months.values()))
 
 
 class AnalyticsService:
+    @staticmethod
+    def summarize(user: User, start: date, end: date, db: Session):
+        """Aggregate check-ins in [start, end) in the database.
+        
+        Returns one row shaped like a rollup (days_checked_in, total_pages,
+        total_videos, goal_hits, best_streak). The best streak is a gaps-and-islands count:
+        consecutive dates minus their row number share the same value.
+        """
+        in_range = (
+            CheckIn.user_id == user.id,
+            CheckIn.check_in_date >= start,
+            CheckIn.check_in_date < end
+        )
+        
+        row_number = func.row_number().over(order_by=CheckIn.check_in_date)
+        islands = db.query(
+            (CheckIn.check_in_date - cast(row_number, Integer)).label("island")
+        ).filter(*in_range).subquery()
+        runs = db.query(
+            func.count().label("length")
+        ).select_from(islands).group_by(islands.c.island).subquery()
+        best_streak = db.query(func.coalesce(func.max(runs.c.length), 0)).scalar_subquery()
+        
+        goal_hit = and_(
+            CheckIn.pages_read >= user.pages_goal,
+            CheckIn.videos_watched >= user.videos_goal
+        )
+        return db.query(
+            func.count(CheckIn.id).label("days_checked_in"),
+            func.coalesce(func.sum(CheckIn.pages_read), 0).label("total_pages"),
+            func.coalesce(func.sum(CheckIn.videos_watched), 0).label("total_videos"),
+            func.count(CheckIn.id).filter(goal_hit).label("goal_hits"),
+            best_streak.label("best_streak")
+        ).filter(*in_range).one()
+    
     @staticmethod
     def get_weekly_summary(user: User, db: Session) -> dict:
         """Get weekly summary for current week"""
@@ -197,29 +976,22 @@ class AnalyticsService:
         week_start = today - timedelta(days=today.weekday())  # Monday
         week_end = week_start + timedelta(days=6)  # Sunday
         
-        check_ins = db.query(CheckIn).filter(
-            CheckIn.user_id == user.id,
-            CheckIn.check_in_date >= week_start,
-            CheckIn.check_in_date <= week_end
-        ).all()
-        
-        days_checked_in = len(check_ins)
-        total_pages = sum(c.pages_read for c in check_ins)
-        total_videos = sum(c.videos_watched for c in check_ins)
+        iso_year, iso_week, _ = today.isocalendar()
+        summary = db.get(WeeklyRollup, (user.id, iso_year, iso_week))
+        if summary is None:
+            # No check-in this week yet, or history not rolled up yet
+            summary = AnalyticsService.summarize(user, week_start, week_end + timedelta(days=1), db)
+        days_checked_in = summary.days_checked_in
         
         # Calculate goal success rate
-        goal_successes = sum(
-            1 for c in check_ins
-            if c.pages_read >= user.pages_goal and c.videos_watched >= user.videos_goal
-        )
-        goal_success_rate = (goal_successes / days_checked_in * 100) if days_checked_in > 0 else 0.0
+        goal_success_rate = (summary.goal_hits / days_checked_in * 100) if days_checked_in > 0 else 0.0
         
         return {
             "week_start": week_start,
             "week_end": week_end,
             "days_checked_in": days_checked_in,
-            "total_pages": total_pages,
-            "total_videos": total_videos,
+            "total_pages": summary.total_pages,
+            "total_videos": summary.total_videos,
             "goal_success_rate": round(goal_success_rate, 1),
             "pages_goal": user.pages_goal,
             "videos_goal": user.videos_goal
@@ -228,37 +1000,16 @@ class AnalyticsService:
     @staticmethod
     def get_monthly_summary(user: User, month: int, year: int, db: Session) -> dict:
         """Get monthly summary for specified month"""
-        check_ins = db.query(CheckIn).filter(
-            CheckIn.user_id == user.id,
-            extract('month', CheckIn.check_in_date) == month,
-            extract('year', CheckIn.check_in_date) == year
-        ).all()
-        
-        total_days = len(check_ins)
-        total_pages = sum(c.pages_read for c in check_ins)
-        total_videos = sum(c.videos_watched for c in check_ins)
-        
-        avg_pages = (total_pages / total_days) if total_days > 0 else 0.0
-        avg_videos = (total_videos / total_days) if total_days > 0 else 0.0
+        month_start = date(year, month, 1)
+        next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
         
-        # Calculate best streak for the month
-        sorted_check_ins = sorted(check_ins, key=lambda x: x.check_in_date)
-        best_streak = 0
-        current_streak = 0
-        last_date = None
+        summary = db.get(MonthlyRollup, (user.id, year, month))
+        if summary is None:
+            summary = AnalyticsService.summarize(user, month_start, next_month, db)
+        total_days = summary.days_checked_in
         
-        for check_in in sorted_check_ins:
-            if last_date is None:
-                current_streak = 1
-            else:
-                days_diff = (check_in.check_in_date - last_date).days
-                if days_diff == 1:
-                    current_streak += 1
-                else:
-                    current_streak = 1
-            
-            best_streak = max(best_streak, current_streak)
-            last_date = check_in.check_in_date
+        avg_pages = (summary.total_pages / total_days) if total_days > 0 else 0.0
+        avg_videos = (summary.total_videos / total_days) if total_days > 0 else 0.0
         
         return {
             "month": month,
@@ -266,7 +1017,7 @@ class AnalyticsService:
             "total_learning_days": total_days,
             "average_pages_per_day": round(avg_pages, 1),
             "average_videos_per_day": round(avg_videos, 1),
-            "best_streak": best_streak,
+            "best_streak": summary.best_streak,
             "pages_goal": user.pages_goal,
             "videos_goal": user.videos_goal
         }
@@ -1,7 +1,15 @@
 #!/bin/sh
 
+WORKERS=${WEB_CONCURRENCY:-1}
+
 if [ "$ENV" = "dev" ]; then
   uvicorn main:app --host 0.0.0.0 --port 8000 --reload
 else
-  uvicorn main:app --host 0.0.0.0 --port 8000
-fi
\ No newline at end of file
+  if [ "$WORKERS" -gt 1 ]; then
+    # Workers write metrics to files here so /metrics covers all of them
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+  fi
+  uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
+fi
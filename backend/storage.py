@@ -0,0 +1,169 @@
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+from config import settings
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageError(Exception):
+    """Raised when an object is missing or cannot be read"""
+
+
+class LocalStorage:
+    """Objects as files in UPLOAD_DIR, served by the app under /uploads.
+
+    Only suitable for a single replica unless the directory is a shared
+    volume. Direct uploads are not supported, clients post to the API.
+    """
+
+    supports_direct_upload = False
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name: str) -> Path:
+        path = (self.directory / name).resolve()
+        if self.directory.resolve() not in path.parents:
+            raise StorageError(f"Invalid object name: {name}")
+        return path
+
+    def put(self, name: str, data: bytes, content_type: str):
+        """Write an object, renamed into place so readers never see a partial file"""
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.parent / f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def get(self, name: str, max_bytes: int) -> bytes:
+        path = self._path(name)
+        try:
+            if path.stat().st_size > max_bytes:
+                raise StorageError(f"Object too large: {name}")
+            return path.read_bytes()
+        except FileNotFoundError:
+            raise StorageError(f"Object not found: {name}")
+
+    def exists(self, name: str) -> bool:
+        return self._path(name).exists()
+
+    def delete(self, name: str):
+        self._path(name).unlink(missing_ok=True)
+
+    def url(self, name: str) -> str:
+        return f"/uploads/{name}"
+
+    def presigned_upload(self, name: str, content_type: str, max_bytes: int, expires_in: int) -> dict:
+        raise StorageError("Direct uploads need STORAGE_BACKEND=s3")
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, ...), shared by every replica.
+
+    Clients can upload straight to the bucket with a presigned POST, so the
+    bytes never pass through the API. boto3 is only needed for this backend.
+    """
+
+    supports_direct_upload = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, public_url: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "auto"})
+        )
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        if public_url:
+            self.public_url = public_url.rstrip("/")
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, name: str, data: bytes, content_type: str):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(name),
+            Body=data,
+            ContentType=content_type,
+            CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+
+    def get(self, name: str, max_bytes: int) -> bytes:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise StorageError(f"Object not found: {name}")
+            raise
+        if obj["ContentLength"] > max_bytes:
+            obj["Body"].close()
+            raise StorageError(f"Object too large: {name}")
+        return obj["Body"].read()
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except self._client_error as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def url(self, name: str) -> str:
+        return f"{self.public_url}/{self._key(name)}"
+
+    def presigned_upload(self, name: str, content_type: str, max_bytes: int, expires_in: int) -> dict:
+        """Presigned POST limited to one key, content type and size"""
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=self._key(name),
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, max_bytes]
+            ],
+            ExpiresIn=expires_in
+        )
+
+
+def create_storage():
+    """Storage for the configured STORAGE_BACKEND"""
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            bucket=settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url or None,
+            region=settings.s3_region or None,
+            public_url=settings.s3_public_url or None
+        )
+    return LocalStorage(settings.upload_dir)
+
+
+storage = create_storage()
@@ -4,6 +4,7 @@ import { dashboardAPI, checkInAPI } from '../utils/api';
 import { useAuth } from '../hooks/useAuth';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
+import { avatarUrl, avatarSrcSet } from '../utils/avatar';
 
 export default function Dashboard() {
   const { user, logout } = useAuth();
@@ -75,7 +76,8 @@ export default function Dashboard() {
           <div className="flex items-center gap-6">
             {user?.profile_picture && (
               <img 
-                src={`/uploads/${user.profile_picture}`} 
+                src={avatarUrl(user.profile_picture, 64)}
+                srcSet={avatarSrcSet(user.profile_picture, 64, 128)}
                 alt={user.username}
                 className="profile-picture-small"
               />
@@ -2,6 +2,7 @@ import { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../hooks/useAuth';
 import { userAPI } from '../utils/api';
+import { avatarUrl, avatarSrcSet } from '../utils/avatar';
 
 export default function Settings() {
   const navigate = useNavigate();
@@ -74,7 +75,8 @@ export default function Settings() {
               <div className="relative">
                 {user?.profile_picture ? (
                   <img 
-                    src={`/uploads/${user.profile_picture}`} 
+                    src={avatarUrl(user.profile_picture, 128)}
+                    srcSet={avatarSrcSet(user.profile_picture, 128, 500)}
                     alt={user.username}
                     className="profile-picture"
                   />
@@ -40,12 +40,30 @@ export const authAPI = {
 export const userAPI = {
   getProfile: () => api.get('/user/profile'),
   updateGoals: (goals) => api.put('/user/goals', goals),
-  uploadProfilePicture: (file) => {
+  uploadProfilePicture: async (file) => {
+    // Upload straight to storage when the backend hands out presigned uploads
+    const upload = await api
+      .post('/user/profile-picture/upload-url', { content_type: file.type })
+      .then((response) => response.data)
+      .catch((error) => {
+        if (error.response?.status === 400) return null;
+        throw error;
+      });
+
+    if (!upload) {
+      const formData = new FormData();
+      formData.append('file', file);
+      return api.post('/user/profile-picture', formData, {
+        headers: { 'Content-Type': 'multipart/form-data' },
+      });
+    }
+
+    // Plain axios: the bucket must not receive our Authorization header
     const formData = new FormData();
+    Object.entries(upload.fields).forEach(([key, value]) => formData.append(key, value));
     formData.append('file', file);
-    return api.post('/user/profile-picture', formData, {
-      headers: { 'Content-Type': 'multipart/form-data' },
-    });
+    await axios.post(upload.url, formData);
+    return api.post('/user/profile-picture/complete', { key: upload.key });
   },
 };
 
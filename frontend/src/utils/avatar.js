@@ -0,0 +1,11 @@
+// Profile pictures are stored as 64, 128 and 500px variants; pictures
+// uploaded before that are a single file with an extension.
+export const avatarUrl = (profilePicture, size) =>
+  profilePicture.includes('.')
+    ? `/uploads/${profilePicture}`
+    : `/uploads/${profilePicture}-${size}.webp`;
+
+export const avatarSrcSet = (profilePicture, size, retinaSize) =>
+  profilePicture.includes('.')
+    ? undefined
+    : `${avatarUrl(profilePicture, size)} 1x, ${avatarUrl(profilePicture, retinaSize)} 2x`;